@@ -0,0 +1,267 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from sessions import MEASURES
+
+
+class RunningStats:
+    """
+    Count, mean and variance updated one value at a time (Welford), or
+    merged from another RunningStats (Chan et al.).
+    """
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self, n=0, mean=0.0, m2=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        if not other.n:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else float("nan")
+
+    @property
+    def sd(self):
+        return math.sqrt(self.variance) if self.n > 1 else float("nan")
+
+
+class LiveAggregates:
+    """
+    Running statistics per (abstract_id, condition, measure) and paired
+    war - neutral difference moments per (abstract_id, measure), updated
+    in O(1) per row as response batches are appended to the store.
+
+    A row whose partner condition hasn't arrived yet waits in `_unpaired`
+    until it does, or until the session's 'complete' status record shows
+    that no partner is coming. An abandoned session may still resume, so
+    its rows keep waiting; only the `max_abandoned` most recently
+    abandoned sessions are kept, and older ones are dropped.
+
+    With `path` set, each batch is appended to a numbered log beside the
+    snapshot (`path` + ".log"), so persisting it costs O(batch). The full
+    state goes to the JSON snapshot, and the log is emptied, once
+    `snapshot_rows` rows or `snapshot_interval` seconds have passed since
+    the last snapshot. On start the snapshot is loaded and the log
+    replayed; log entries the snapshot already holds are skipped. Replicas
+    sharing the files apply batches one at a time under the writer's drain
+    lock, and before each one catch up on what the others have logged.
+    The files are local, so with replicas on several hosts each host's
+    aggregates cover only the batches its own writer stored.
+    """
+
+    def __init__(self, path=None, measures=MEASURES, category_of=None,
+                 snapshot_rows=5000, snapshot_interval=60.0, max_abandoned=1000):
+        self.path = path
+        self.measures = measures
+        self.category_of = category_of or (lambda abstract_id: abstract_id.split("_")[0])
+        self.snapshot_rows = snapshot_rows
+        self.snapshot_interval = snapshot_interval
+        self.max_abandoned = max_abandoned
+        self.ratings = {}      # (abstract_id, condition, measure) -> RunningStats
+        self.diffs = {}        # (abstract_id, measure) -> RunningStats
+        self._unpaired = {}    # session_id -> {abstract_id: row}
+        self._abandoned = OrderedDict()  # session ids with unpaired rows, oldest first
+        self._lock = threading.Lock()
+        self._seq = 0          # last log entry applied
+        self._snapshot = None  # identity of the snapshot file last loaded or written
+        self._offset = 0       # bytes of the log applied
+        self._logged = 0       # rows applied since the last snapshot
+        self._snapshot_at = time.monotonic()
+        if path:
+            self._catch_up()
+
+    def update(self, rows):
+        with self._lock:
+            if self.path:
+                self._catch_up()
+            for row in rows:
+                self._add(row)
+            if self.path and rows:
+                self._append(rows)
+                if (self._logged >= self.snapshot_rows
+                        or time.monotonic() - self._snapshot_at >= self.snapshot_interval):
+                    self._save()
+
+    def _add(self, row):
+        session_id = row["session_id"]
+        if row.get("trial_index") is None:
+            # Session status record
+            if row.get("session_status") == "complete":
+                self._unpaired.pop(session_id, None)
+                self._abandoned.pop(session_id, None)
+            elif session_id in self._unpaired:
+                self._abandoned[session_id] = None
+                self._abandoned.move_to_end(session_id)
+                while len(self._abandoned) > self.max_abandoned:
+                    self._unpaired.pop(self._abandoned.popitem(last=False)[0], None)
+            return
+        if session_id in self._abandoned:
+            # Resumed: stays bounded (a second 'abandoned' is deduplicated
+            # by the writer), but counts as recent again
+            self._abandoned.move_to_end(session_id)
+        abstract_id, condition = row["abstract_id"], row["condition"]
+        for m in self.measures:
+            if row.get(m) is None:
+                continue
+            key = (abstract_id, condition, m)
+            stats = self.ratings.get(key)
+            if stats is None:
+                stats = self.ratings[key] = RunningStats()
+            stats.update(float(row[m]))
+
+        waiting = self._unpaired.get(session_id, {})
+        partner = waiting.pop(abstract_id, None)
+        if partner is None or partner["condition"] == condition:
+            self._unpaired.setdefault(session_id, {})[abstract_id] = self._slim(row)
+            return
+        if not waiting:
+            self._unpaired.pop(session_id, None)
+            self._abandoned.pop(session_id, None)
+        war, neutral = (row, partner) if condition == "war" else (partner, row)
+        for m in self.measures:
+            if war.get(m) is None or neutral.get(m) is None:
+                continue
+            stats = self.diffs.get((abstract_id, m))
+            if stats is None:
+                stats = self.diffs[(abstract_id, m)] = RunningStats()
+            stats.update(float(war[m]) - float(neutral[m]))
+
+    # --- Views for the dashboard ---
+
+    def rating_table(self):
+        with self._lock:
+            return [
+                {"abstract_id": a, "condition": c, "measure": m,
+                 "n": s.n, "mean": s.mean, "sd": s.sd}
+                for (a, c, m), s in sorted(self.ratings.items())
+            ]
+
+    def effect_table(self, by_category=False):
+        """
+        Paired differences per abstract, or pooled per category, plus an
+        overall row per measure, with Cohen's dz.
+        """
+        with self._lock:
+            pooled = {}
+            for (a, m), s in self.diffs.items():
+                group = self.category_of(a) if by_category else a
+                for key in ((group, m), ("all", m)):
+                    pooled.setdefault(key, RunningStats()).merge(s)
+        rows = []
+        for (group, m), s in sorted(pooled.items()):
+            dz = s.mean / s.sd if s.n > 1 and s.sd else float("nan")
+            rows.append({"group": group, "measure": m, "n": s.n,
+                         "mean_diff": s.mean, "sd": s.sd, "dz": dz})
+        return rows
+
+    # --- Snapshot and log ---
+
+    def _slim(self, row):
+        # The fields _add reads; the log and snapshot keep nothing else
+        keys = ("session_id", "trial_index", "abstract_id", "condition", *self.measures)
+        return {k: row[k] for k in keys if row.get(k) is not None}
+
+    def _catch_up(self):
+        # Reload if another replica has written a snapshot since, then
+        # apply the log entries not applied yet
+        try:
+            with open(self.path) as f:
+                snapshot = _identity(os.fstat(f.fileno()))
+                if snapshot != self._snapshot:
+                    self._load(f, snapshot)
+        except FileNotFoundError:
+            pass
+        try:
+            f = open(self.path + ".log", "rb")
+        except FileNotFoundError:
+            self._offset = 0
+            return
+        with f:
+            if os.fstat(f.fileno()).st_size < self._offset:
+                self._offset = 0
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    # Cut short by a crash (or still being written, at start);
+                    # _append drops it
+                    break
+                entry = json.loads(line)
+                if entry["seq"] > self._seq:
+                    for row in entry["rows"]:
+                        self._add(row)
+                    self._seq = entry["seq"]
+                    self._logged += len(entry["rows"])
+                self._offset += len(line)
+
+    def _append(self, rows):
+        self._seq += 1
+        entry = {"seq": self._seq, "rows": [
+            {"session_id": r["session_id"], "session_status": r.get("session_status")}
+            if r.get("trial_index") is None else self._slim(r)
+            for r in rows
+        ]}
+        with open(self.path + ".log", "ab") as f:
+            if f.tell() > self._offset:
+                f.truncate(self._offset)
+            f.write(json.dumps(entry).encode() + b"\n")
+            self._offset = f.tell()
+        self._logged += len(rows)
+
+    def _save(self):
+        state = {
+            "seq": self._seq,
+            "ratings": [[*k, s.n, s.mean, s.m2] for k, s in self.ratings.items()],
+            "diffs": [[*k, s.n, s.mean, s.m2] for k, s in self.diffs.items()],
+            "unpaired": [row for waiting in self._unpaired.values() for row in waiting.values()],
+            "abandoned": list(self._abandoned),
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            # dumps: json.dump encodes in pure Python
+            f.write(json.dumps(state))
+        os.replace(tmp, self.path)
+        self._snapshot = _identity(os.stat(self.path))
+        # A crash before this leaves entries the snapshot holds; they are skipped
+        open(self.path + ".log", "wb").close()
+        self._offset = 0
+        self._logged = 0
+        self._snapshot_at = time.monotonic()
+
+    def _load(self, f, snapshot):
+        state = json.load(f)
+        self.ratings = {(a, c, m): RunningStats(n, mean, m2) for a, c, m, n, mean, m2 in state["ratings"]}
+        self.diffs = {(a, m): RunningStats(n, mean, m2) for a, m, n, mean, m2 in state["diffs"]}
+        self._unpaired = {}
+        for row in state["unpaired"]:
+            self._unpaired.setdefault(row["session_id"], {})[row["abstract_id"]] = self._slim(row)
+        self._abandoned = OrderedDict.fromkeys(state.get("abandoned", []))
+        # Snapshots written before the log existed have no "seq"
+        self._seq = state.get("seq", 0)
+        self._snapshot = snapshot
+        self._offset = 0
+        self._logged = 0
+
+
+def _identity(st):
+    # A snapshot is replaced, never rewritten in place, so a new inode or
+    # mtime means another replica has written one
+    return st.st_ino, st.st_mtime_ns
@@ -0,0 +1,192 @@
+"""
+Paired war-vs-neutral effects over the response store.
+
+    python analysis.py responses.db --boot 2000 --workers 4
+    python analysis.py responses.db --exclude-flagged
+    python analysis.py export/ --boot 2000      # a Parquet export (export.py)
+    python analysis.py export/ --exclude-flagged
+
+Every participant rates each of their abstracts once per condition, so
+the unit of analysis is the within-session difference war - neutral per
+(session, abstract) and measure. Effects are reported per abstract, per
+category and overall, with percentile bootstrap confidence intervals that
+resample sessions. With --exclude-flagged, sessions flagged by the
+data-quality screen (screening.py) are dropped first; the screen only
+rescreens sessions that received rows since its last run.
+"""
+import argparse
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from sequence import CONDITIONS
+from sessions import MEASURES
+
+KEYS = ["session_id", "abstract_id"]
+
+
+def load_responses(path, table="responses"):
+    """
+    Reads the columns the analysis needs from a SQLiteStore database, or
+    from a Parquet export directory (export.py). Session status records
+    (no trial_index) are left out.
+    """
+    names = KEYS + ["condition", "trial_index"] + list(MEASURES)
+    if os.path.isdir(path):
+        df = pd.read_parquet(path, columns=names)
+        df = df[df["trial_index"].notna()]
+        return df.astype({"abstract_id": str, "condition": str})
+    columns = ", ".join(f'"{c}"' for c in names)
+    with sqlite3.connect(path) as conn:
+        return pd.read_sql_query(f'SELECT {columns} FROM "{table}" WHERE "trial_index" IS NOT NULL', conn)
+
+
+def paired_differences(df, measures=MEASURES, category_map=None):
+    """
+    Returns one row per (session, abstract) that has both conditions, with
+    the war - neutral difference for each measure and the abstract's
+    category. If a trial was stored more than once the last copy wins.
+    """
+    df = df.drop_duplicates(KEYS + ["condition"], keep="last")
+    wide = df.set_index(KEYS + ["condition"])[list(measures)].unstack("condition")
+    # Both conditions as columns even when a (filtered) frame lacks one
+    wide = wide.reindex(columns=pd.MultiIndex.from_product(
+        [list(measures), CONDITIONS], names=[None, "condition"])).dropna()
+    diffs = pd.DataFrame(
+        wide.xs("war", axis=1, level="condition").to_numpy(dtype=float)
+        - wide.xs("neutral", axis=1, level="condition").to_numpy(dtype=float),
+        index=wide.index,
+        columns=list(measures),
+    ).reset_index()
+    if category_map is not None:
+        diffs["category"] = diffs["abstract_id"].map(category_map)
+    else:
+        diffs["category"] = diffs["abstract_id"].str.split("_", n=1).str[0]
+    return diffs
+
+
+def summarize(values):
+    """
+    Column-wise mean, SD, n, Cohen's dz and t for a (sessions x measures) array.
+    """
+    n = values.shape[0]
+    mean = values.mean(axis=0)
+    sd = values.std(axis=0, ddof=1) if n > 1 else np.full(values.shape[1], np.nan)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        dz = mean / sd
+        t = dz * np.sqrt(n)
+    return mean, sd, n, dz, t
+
+
+def _bootstrap(task):
+    # Runs in a worker process: percentile CI of the mean for each column
+    key, values, n_boot, level, seed = task
+    rng = np.random.default_rng(seed)
+    n = values.shape[0]
+    means = np.empty((n_boot, values.shape[1]))
+    # Turn resampled indexes into per-session counts with one bincount, so
+    # each chunk of resample means is a single matrix product. Chunks keep
+    # the count matrix around 8M entries.
+    chunk = max(1, 8_000_000 // max(n, 1))
+    for start in range(0, n_boot, chunk):
+        stop = min(n_boot, start + chunk)
+        b = stop - start
+        idx = rng.integers(0, n, size=(b, n)) + (np.arange(b) * n)[:, None]
+        counts = np.bincount(idx.ravel(), minlength=b * n).reshape(b, n)
+        means[start:stop] = counts @ values / n
+    alpha = (1 - level) / 2
+    lo, hi = np.quantile(means, [alpha, 1 - alpha], axis=0)
+    return key, lo, hi
+
+
+def _session_means(diffs, group_col, measures):
+    """
+    Yields (group, sessions x measures array) with each session's mean
+    difference within the group, so bootstraps resample sessions.
+    """
+    if diffs.empty:
+        return
+    if group_col is None:
+        grouped = diffs.groupby("session_id", sort=False)[list(measures)].mean()
+        yield "all", grouped.to_numpy()
+        return
+    session_level = diffs.groupby([group_col, "session_id"], sort=True)[list(measures)].mean()
+    values = session_level.to_numpy()
+    groups = session_level.index.get_level_values(0)
+    # Groups are contiguous after the sort, so slice instead of filtering
+    bounds = np.flatnonzero(groups[1:] != groups[:-1]) + 1
+    starts = np.concatenate([[0], bounds])
+    stops = np.concatenate([bounds, [len(groups)]])
+    for start, stop in zip(starts, stops):
+        yield groups[start], values[start:stop]
+
+
+def effects(diffs, measures=MEASURES, n_boot=2000, level=0.95, workers=None, seed=0):
+    """
+    Returns {"item": df, "category": df, "overall": df}, one row per group
+    and measure with mean difference, SD, n, dz, t and bootstrap CI bounds.
+    Bootstraps run in parallel across a process pool (`workers=1` runs
+    them in this process).
+    """
+    levels = {"item": "abstract_id", "category": "category", "overall": None}
+    blocks = {name: list(_session_means(diffs, col, measures)) for name, col in levels.items()}
+
+    tasks = []
+    for name, groups in blocks.items():
+        for g, values in groups:
+            tasks.append(((name, g), values, n_boot, level, seed + len(tasks)))
+    if n_boot and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            cis = dict((key, (lo, hi)) for key, lo, hi in pool.map(_bootstrap, tasks, chunksize=4))
+    elif n_boot:
+        cis = dict((key, (lo, hi)) for key, lo, hi in map(_bootstrap, tasks))
+    else:
+        cis = {}
+
+    out = {}
+    for name, groups in blocks.items():
+        records = []
+        for g, values in groups:
+            mean, sd, n, dz, t = summarize(values)
+            lo, hi = cis.get((name, g), (np.full(len(measures), np.nan),) * 2)
+            for j, measure in enumerate(measures):
+                records.append({
+                    "group": g, "measure": measure, "n": n,
+                    "mean_diff": mean[j], "sd": sd[j], "dz": dz[j], "t": t[j],
+                    "ci_low": lo[j], "ci_high": hi[j],
+                })
+        out[name] = pd.DataFrame.from_records(records)
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", nargs="?", default=os.environ.get("SURVEY_DB_PATH", "responses.db"))
+    parser.add_argument("--boot", type=int, default=2000, help="bootstrap resamples (0 to skip)")
+    parser.add_argument("--level", type=float, default=0.95)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--exclude-flagged", action="store_true", help="drop sessions flagged by screening.py")
+    args = parser.parse_args()
+
+    df = load_responses(args.db)
+    if args.exclude_flagged:
+        from screening import open_screener
+        screener = open_screener(args.db)
+        screener.update()
+        excluded = screener.excluded_sessions()
+        screener.close()
+        df = df[~df["session_id"].isin(excluded)]
+        print(f"excluded {len(excluded)} flagged session(s)")
+    diffs = paired_differences(df)
+    results = effects(diffs, n_boot=args.boot, level=args.level, workers=args.workers)
+    with pd.option_context("display.width", 120, "display.max_rows", 500):
+        for name in ("overall", "category", "item"):
+            print(f"\n== {name} ==")
+            print(results[name].round(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
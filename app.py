@@ -1,9 +1,27 @@
 import streamlit as st
-import pandas as pd
-from streamlit_gsheets import GSheetsConnection
-import random
+import hmac
+import os
+import threading
 import time
-from content import ABSTRACTS
+from array import array
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from content_store import ContentStore
+from storage import GSheetsStore, SQLiteStore
+from streaming import export_route
+from sheets import SheetsPool, gsheets_connector, local_worksheet
+from writer import WriteBehindQueue
+from coordination import RedisCoordinator, SQLiteCoordinator, local_redis, redis_client
+from sessions import ResponseBuffer, RedisSessionLog, SessionActivity, SessionLog, new_session_id, status_row
+from sequence import decode, encode
+from scheduler import AssignmentScheduler
+from aggregates import LiveAggregates
+from reaper import SessionReaper
+from metrics import REGISTRY, serve as serve_metrics, time_block, timed
+from render import (
+    CONSENT_HTML, CONSENT_TITLE, CUSTOM_CSS, INSTRUCTIONS_HTML, INSTRUCTIONS_TITLE,
+    QUESTION_DIVIDER, QUESTION_HEADER_1, QUESTION_HEADER_2, RenderCache,
+)
 
 # Page config
 st.set_page_config(
@@ -12,196 +30,354 @@ st.set_page_config(
     layout="centered"
 )
 
-# --- Helper Functions for Randomization ---
+# Start of this script run; see the end of the file
+_run_started = time.perf_counter()
+
+# --- Content ---
 
-def generate_experiment_sequence(abstracts):
+@st.cache_resource(show_spinner=False)
+def get_content():
     """
-    Generates a sequence of 40 abstracts (20 unique IDs x 2 conditions).
-    Balanced across 5 categories: 4 unique IDs per category.
+    Returns the indexed stimulus table. Set SURVEY_CONTENT_PATH to a JSONL
+    or CSV file to use an external stimulus set instead of content.py.
     """
-    # 1. Group by category (assuming id format 'prefix_number')
-    categories = {}
-    for item in abstracts:
-        cat_prefix = item['id'].split('_')[0]
-        if cat_prefix not in categories:
-            categories[cat_prefix] = []
-        categories[cat_prefix].append(item)
-    
-    selected_items = []
-    
-    # 2. For each category, select 4 unique IDs
-    for cat, items in categories.items():
-        # We need at least 4 items per category. 
-        if len(items) < 4:
-            chosen = items
-        else:
-            chosen = random.sample(items, 4)
-            
-        # For each chosen ID, add BOTH War and Neutral conditions
-        for item in chosen:
-            selected_items.append({
-                "abstract": item,
-                "condition": "war"
-            })
-            selected_items.append({
-                "abstract": item,
-                "condition": "neutral"
-            })
-            
-    # 3. Shuffle the final sequence completely
-    random.shuffle(selected_items)
-    return selected_items
+    path = os.environ.get("SURVEY_CONTENT_PATH")
+    if path:
+        return ContentStore.open(path)
+    from content import ABSTRACTS
+    return ContentStore.from_records(ABSTRACTS)
+
+# --- Storage ---
+
+@st.cache_resource(show_spinner=False)
+def get_store():
+    """
+    Returns the process-wide response store, shared by all sessions.
+    Select the backend with SURVEY_STORAGE=gsheets (default), sqlite, or
+    local-gsheets (in-memory Sheets stand-in for offline testing).
+    """
+    backend = os.environ.get("SURVEY_STORAGE", "gsheets")
+    if backend == "sqlite":
+        return SQLiteStore(os.environ.get("SURVEY_DB_PATH", "responses.db"))
+    if backend == "local-gsheets":
+        worksheet = local_worksheet(
+            "Sheet1",
+            latency=float(os.environ.get("SURVEY_LOCAL_SHEETS_LATENCY", 0)),
+            failure_rate=float(os.environ.get("SURVEY_LOCAL_SHEETS_FAILURE_RATE", 0)),
+        )
+        return GSheetsStore(SheetsPool(lambda: worksheet, rate=1000.0, burst=1000))
+    # Imported here: the Sheets client pulls in pandas and takes about a
+    # second, which the consent page shouldn't wait for
+    from streamlit_gsheets import GSheetsConnection
+    conn = st.connection("gsheets", type=GSheetsConnection)
+    return GSheetsStore(SheetsPool(gsheets_connector(conn, worksheet="Sheet1")))
+
+@st.cache_resource(show_spinner=False)
+def get_redis():
+    """
+    Returns the Redis client for SURVEY_COORDINATION=redis (at
+    SURVEY_REDIS_URL) or local-redis (in-process stand-in), else None.
+    """
+    backend = os.environ.get("SURVEY_COORDINATION", "sqlite")
+    if backend == "redis":
+        return redis_client(os.environ.get("SURVEY_REDIS_URL", "redis://localhost:6379/0"))
+    if backend == "local-redis":
+        return local_redis()
+    return None
+
+@st.cache_resource(show_spinner=False)
+def get_coordinator():
+    """
+    Returns the locks and counters shared by all replicas of the app:
+    file-locked SQLite at SURVEY_COORD_PATH (default coord.db) for
+    replicas on one host, or Redis for replicas on several.
+    """
+    client = get_redis()
+    if client is not None:
+        return RedisCoordinator(client)
+    return SQLiteCoordinator(os.environ.get("SURVEY_COORD_PATH", "coord.db"))
+
+@st.cache_resource(show_spinner=False)
+def get_writer():
+    """
+    Returns the process-wide write-behind queue. Rows from every session
+    are spooled to disk and flushed to the store in batches by a
+    background thread.
+    """
+    spool_path = os.environ.get("SURVEY_SPOOL_PATH", "spool.db")
+    writer = WriteBehindQueue(get_store(), spool_path=spool_path, coordinator=get_coordinator())
+    writer.listeners.append(get_aggregates().update)
+    writer.start()
+    REGISTRY.gauge("survey_queued_rows", writer.pending, help="Rows spooled but not yet in the store")
+    return writer
+
+@st.cache_resource(show_spinner=False)
+def get_aggregates():
+    """
+    Returns the running per-item statistics behind the live dashboard,
+    updated as each batch reaches the store.
+    """
+    content = get_content()
+    return LiveAggregates(
+        os.environ.get("SURVEY_AGGREGATES_PATH", "aggregates.json"),
+        category_of=lambda abstract_id: content.categories[content.index[abstract_id]]
+        if abstract_id in content.index else abstract_id.split("_")[0],
+    )
+
+@st.cache_resource(show_spinner=False)
+def get_session_log():
+    """
+    Returns the log of submitted trials: local SQLite, or Redis when
+    replicas coordinate through Redis.
+    """
+    client = get_redis()
+    if client is not None:
+        return RedisSessionLog(client)
+    return SessionLog(os.environ.get("SURVEY_TRIAL_LOG_PATH", "trials.db"))
+
+@st.cache_resource(show_spinner=False)
+def get_scheduler():
+    """
+    Returns the counterbalancing scheduler, seeded with the sessions
+    already in the session log. Its counts are shared by all replicas.
+    """
+    content = get_content()
+    scheduler = AssignmentScheduler(content, coordinator=get_coordinator())
+    scheduler.record(
+        [(content.index[abstract_id], condition) for abstract_id, condition in sequence
+         if abstract_id in content.index]
+        for sequence in get_session_log().sequences()
+    )
+    return scheduler
+
+# --- Monitoring ---
+
+@st.cache_resource
+def get_activity():
+    """
+    Returns the process-wide last-activity tracker for participant sessions.
+    """
+    activity = SessionActivity()
+    REGISTRY.gauge("survey_active_sessions", activity.active, help="Sessions active in the last 15 minutes")
+    return activity
+
+# What a session keeps in st.session_state; dropped when it goes idle
+SESSION_KEYS = (
+    'session_id', 'page', 'experiment_sequence', 'current_index', 'responses',
+    'saved', 'start_time', 'trial_shown',
+)
+# The part of it restore_session() rebuilds from the session log
+RESTORED_KEYS = SESSION_KEYS[:5]
+
+@st.cache_resource
+def get_reaper():
+    """
+    Starts the process-wide reaper for idle sessions: after
+    SURVEY_IDLE_TIMEOUT seconds (default 1800, 0 disables) their partial
+    responses are flushed and their in-memory state is released.
+    """
+    timeout = float(os.environ.get("SURVEY_IDLE_TIMEOUT", "1800"))
+    if timeout <= 0:
+        return None
+    reaper = SessionReaper(
+        get_session_log(), lambda rows: get_writer().put(rows), get_activity(),
+        idle_timeout=timeout, interval=min(60.0, timeout / 2),
+        coordinator=get_coordinator(), release_keys=SESSION_KEYS,
+    )
+    return reaper.start()
+
+@st.cache_resource
+def start_metrics_server():
+    """
+    Serves Prometheus metrics on SURVEY_METRICS_PORT, if set, along with
+    the admin-token response export at /export.
+    """
+    port = os.environ.get("SURVEY_METRICS_PORT")
+    if not port:
+        return None
+    routes = {"/export": export_route(get_store, os.environ.get("SURVEY_ADMIN_TOKEN"))}
+    return serve_metrics(int(port), routes=routes)
+
+def is_admin():
+    token = os.environ.get("SURVEY_ADMIN_TOKEN")
+    return bool(token) and hmac.compare_digest(st.query_params.get("token", ""), token)
+
+def show_metrics():
+    st.title("Metrics")
+    st.code(REGISTRY.render(), language="text")
+
+def show_dashboard():
+    # Reads only the running aggregates, never the stored rows
+    aggregates = get_aggregates()
+    st.title("Live Results")
+    st.caption(f"{get_writer().pending()} rows waiting to be stored are not included yet.")
+    level = st.radio("Effects by", ["category", "abstract"], horizontal=True)
+    st.subheader("War - neutral differences")
+    st.dataframe(aggregates.effect_table(by_category=level == "category"), hide_index=True)
+    st.subheader("Ratings by abstract and condition")
+    st.dataframe(aggregates.rating_table(), hide_index=True)
+
+start_metrics_server()
+
+# Admin pages never create a participant session
+if st.query_params.get("admin") and is_admin():
+    if st.query_params.get("admin") == "metrics":
+        show_metrics()
+    elif st.query_params.get("admin") == "dashboard":
+        show_dashboard()
+    st.stop()
 
 # --- Session State Initialization ---
 
-if 'page' not in st.session_state:
-    st.session_state.page = 'consent'
+def restore_session(session_id):
+    """
+    Restores a participant's progress from the session log.
+    Returns False if the session is unknown.
+    """
+    saved = get_session_log().load(session_id)
+    if saved is None:
+        return False
+    st.session_state.session_id = session_id
+    st.session_state.page = saved['page']
+    st.session_state.experiment_sequence = array('I', [
+        encode(get_content().index[abstract_id], condition)
+        for abstract_id, condition in saved['sequence']
+    ])
+    st.session_state.current_index = saved['current_index']
+    st.session_state.responses = ResponseBuffer.from_rows(
+        len(st.session_state.experiment_sequence), saved['responses']
+    )
+    if saved['status'] == 'complete':
+        st.session_state.saved = True
+    return True
 
-if 'experiment_sequence' not in st.session_state:
-    # Generate the sequence once at the start
-    st.session_state.experiment_sequence = generate_experiment_sequence(ABSTRACTS)
+def start_session():
+    # Only the token here: the consent page needs nothing else, and the
+    # sequence is assigned once the participant agrees
+    st.session_state.session_id = new_session_id()
+    st.session_state.page = 'consent'
+    # Carry the token in the URL so a reload or reconnect resumes this session
+    st.query_params["sid"] = st.session_state.session_id
 
-if 'current_index' not in st.session_state:
+def assign_sequence():
+    """
+    Assigns the session's sequence and creates its session log record.
+    """
+    if 'experiment_sequence' in st.session_state:
+        return
+    with time_block("survey_sequence_seconds"):
+        st.session_state.experiment_sequence = get_scheduler().assign()
     st.session_state.current_index = 0
+    st.session_state.responses = ResponseBuffer(len(st.session_state.experiment_sequence))
+    # The log stores abstract ids rather than indexes so it survives content edits
+    sequence = [decode(code) for code in st.session_state.experiment_sequence]
+    get_session_log().start(
+        st.session_state.session_id,
+        [[get_content().ids[i], condition] for i, condition in sequence],
+    )
 
-if 'responses' not in st.session_state:
-    st.session_state.responses = []  # List of dicts
+def ensure_session():
+    """
+    Sets up the session's state unless it is all in place: restores it
+    from the session log by the URL token, or else starts a new session.
+    The reaper may release an idle session's state between two reruns,
+    and a form callback or fragment rerun runs without the setup at the
+    top of the script, so they call this first. Returns True if the state
+    was already in place.
+    """
+    state = st.session_state
+    needed = ('session_id', 'page') if state.get('page') == 'consent' else RESTORED_KEYS
+    if all(key in state for key in needed):
+        return True
+    sid = st.query_params.get("sid")
+    if not sid or not restore_session(sid):
+        start_session()
+    return False
+
+ensure_session()
 
 if 'start_time' not in st.session_state:
     st.session_state.start_time = time.time()
 
-if 'session_id' not in st.session_state:
-    st.session_state.session_id = str(time.time())
+def session_handle():
+    """
+    Returns the session's thread-safe state (which outlives this script
+    run, unlike st.session_state's binding to it) and a check that the
+    Streamlit session still exists, so the reaper can release an idle
+    session from its thread. Deleting through it takes the lock the
+    script run takes.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        return None, None
+    state = ctx.session_state
+    if not runtime.exists():
+        return state, None
+    server, streamlit_id = runtime.get_instance(), ctx.session_id
+    return state, lambda: server.is_active_session(streamlit_id)
+
+get_activity().touch(st.session_state.session_id, *session_handle())
+get_reaper()
 
 def next_page(page_name):
     st.session_state.page = page_name
+    with time_block("survey_session_log_seconds", op="set_page"):
+        get_session_log().set_page(st.session_state.session_id, page_name)
     st.rerun()
 
-# --- CSS Styling ---
+# --- Rendering ---
+
+@st.cache_resource(show_spinner=False)
+def get_render_cache():
+    """
+    Pre-rendered abstract cards and progress labels, shared by all sessions.
+    """
+    return RenderCache(get_content())
+
+@st.cache_resource
+def warm_up():
+    """
+    Loads what the later pages need (content and the render cache's
+    first cards, the scheduler, the Sheets client, store and writer) in a background
+    thread, once per process, so the first consent page doesn't wait.
+    """
+    def run():
+        for step in (get_content, lambda: get_render_cache().warm(), get_scheduler, get_writer):
+            try:
+                step()
+            except Exception:
+                # The page that needs it will load it again and report errors
+                pass
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
 
 def inject_custom_css():
-    st.markdown("""
-        <style>
-        /* General app styling */
-        .stApp {
-            background-color: #f8f9fa;
-        }
-        
-        /* Abstract Card Styling */
-        .abstract-card {
-            background-color: #ffffff;
-            padding: 2.5rem;
-            border-radius: 12px;
-            box-shadow: 0 4px 12px rgba(0,0,0,0.05);
-            margin-bottom: 2rem;
-            border-left: 5px solid #4a90e2;
-        }
-        
-        .abstract-text {
-            font-family: 'Georgia', serif;
-            font-size: 1.0rem;
-            line-height: 1.6;
-            color: #2c3e50;
-        }
-        
-        .question-header {
-            color: #7f8c8d;
-            font-size: 1.2rem;
-            text-transform: uppercase;
-            letter-spacing: 1px;
-            margin-bottom: 1rem;
-            font-weight: 600;
-        }
-        
-        /* Slider Styling Tweaks */
-        .stSlider label p {
-            font-weight: 400 !important;
-            color: #34495e !important;
-            font-size: 1.1rem !important;
-        }
-        
-        /* Progress Bar */
-        .progress-text {
-            text-align: center;
-            color: #7f8c8d;
-            font-size: 0.9rem;
-            margin-bottom: 0.5rem;
-        }
-        
-        /* Buttons */
-        .stButton button {
-            width: 100%;
-            background-color: #4a90e2;
-            color: white;
-            font-weight: 600;
-            border-radius: 8px;
-            padding: 0.5rem 1rem;
-            border: none;
-        }
-        .stButton button:hover {
-            background-color: #357abd;
-            color: white;
-        }
-        
-        /* Hide Streamlit Form Border */
-        [data-testid="stForm"] {
-            border: none;
-            padding: 0;
-        }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # --- Pages ---
 
+@timed("survey_page_seconds", page="consent")
 def show_consent():
     inject_custom_css()
-    st.markdown("<h1 style='text-align: center; color: #2c3e50;'>Research Study Participation</h1>", unsafe_allow_html=True)
+    st.markdown(CONSENT_TITLE, unsafe_allow_html=True)
     
-    st.markdown("""
-    <div style='background-color: white; padding: 2rem; border-radius: 12px; box-shadow: 0 2px 8px rgba(0,0,0,0.05);'>
-        <h3 style='color: #2c3e50; margin-top: 0;'>Welcome</h3>
-        <p style='font-size: 1.1rem; line-height: 1.6;'>
-            We are conducting a scientific study on how people interpret and respond to scientific texts. 
-            Your contribution is valuable to helping us understand communication dynamics in science.
-        </p>
-        <hr style='border: 0; border-top: 1px solid #eee; margin: 1.5rem 0;'>
-        <p><strong>What to expect:</strong></p>
-        <ul style='line-height: 1.6;'>
-            <li>You will read a series of <strong>40 short abstracts</strong>.</li>
-            <li>For each, you will answer 4 brief questions ensuring your impressions.</li>
-            <li>The total time required is approximately <strong>20-30 minutes</strong>.</li>
-        </ul>
-        <p style='font-size: 0.9rem; color: #666; margin-top: 1.5rem;'>
-            <em>Your participation is entirely voluntary, and all responses will remain anonymous.</em>
-        </p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(CONSENT_HTML, unsafe_allow_html=True)
     
     st.caption("")
     col1, col2, col3 = st.columns([1, 1, 1])
     with col2:
         if st.button("I Agree to Participate"):
+            assign_sequence()
             next_page('instructions')
+    warm_up()
 
+@timed("survey_page_seconds", page="instructions")
 def show_instructions():
     inject_custom_css()
-    st.markdown("<h1 style='text-align: center; color: #2c3e50;'>Instructions</h1>", unsafe_allow_html=True)
+    st.markdown(INSTRUCTIONS_TITLE, unsafe_allow_html=True)
     
-    st.markdown("""
-    <div style='background-color: white; padding: 2rem; border-radius: 12px; box-shadow: 0 2px 8px rgba(0,0,0,0.05);'>
-        <p style='font-size: 1.2rem; line-height: 1.6; text-align: center;'>
-            In this task, you will be presented with scientific abstracts, one at a time.
-        </p>
-        <br>
-        <div style='display: flex; justify-content: center;'>
-            <div style='text-align: left; max-width: 600px;'>
-                <p><strong>1. Read Carefully:</strong> Please read each abstract thoroughly.</p>
-                <p><strong>2. Rate Honestly:</strong> There are no right or wrong answers. We are interested in your immediate, honest impressions.</p>
-                <p><strong>3. Stay Focused:</strong> Please try to complete the session in one sitting.</p>
-            </div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(INSTRUCTIONS_HTML, unsafe_allow_html=True)
     
     st.caption("")
     col1, col2, col3 = st.columns([3, 2, 3])
@@ -209,8 +385,58 @@ def show_instructions():
         if st.button("Start Experiment"):
             next_page('experiment')
 
+def submit_trial(index, abstract_id, condition):
+    """
+    Form callback: records the submitted ratings and advances the index.
+    Runs before the fragment rerun, so the next abstract is drawn directly.
+    """
+    submitted_at = time.monotonic()
+    ensure_session()
+    # A form for any trial but the current one is stale: a duplicate submit
+    # that arrives after the index moved on, or one from before the state
+    # was released and restored from the log
+    if st.session_state.page != 'experiment' or st.session_state.current_index != index:
+        return
+    get_activity().touch(st.session_state.session_id)
+    shown_index, shown_at = st.session_state.get('trial_shown', (None, None))
+    if shown_index != index:
+        shown_at = None
+    response_data = {
+        "session_id": st.session_state.session_id,
+        "trial_index": index + 1,
+        "abstract_id": abstract_id,
+        "condition": condition,
+        "credibility": st.session_state[f"credibility_{index}"],
+        "urgency": st.session_state[f"urgency_{index}"],
+        "policy_support": st.session_state[f"policy_support_{index}"],
+        "gov_funding": st.session_state[f"gov_funding_{index}"],
+        "timestamp": time.time(),
+        # Monotonic server clock: only differences within a session are meaningful
+        "shown_at_mono": shown_at,
+        "submitted_at_mono": submitted_at,
+        "response_ms": round((submitted_at - shown_at) * 1000, 1) if shown_at is not None else None,
+    }
+    st.session_state.responses.append(response_data)
+    # Persist the trial immediately so a dropped tab loses at most one trial
+    with time_block("survey_session_log_seconds", op="record_trial"):
+        get_session_log().record_trial(st.session_state.session_id, response_data)
+    
+    # Advance index
+    st.session_state.current_index += 1
+
+@timed("survey_page_seconds", page="experiment")
 def show_experiment():
     inject_custom_css()
+    show_trial()
+
+@st.fragment
+@timed("survey_page_seconds", page="trial")
+def show_trial():
+    # Submitting the form reruns only this fragment; the rest of the page
+    # (CSS, routing, session setup) is left as it is.
+    if not ensure_session() and st.session_state.page != 'experiment':
+        st.rerun(scope="app")
+    get_activity().touch(st.session_state.session_id)
     
     # Check if we are done
     if st.session_state.current_index >= len(st.session_state.experiment_sequence):
@@ -220,94 +446,69 @@ def show_experiment():
     # Get current item
     index = st.session_state.current_index
     total = len(st.session_state.experiment_sequence)
-    current_item = st.session_state.experiment_sequence[index]
-    abstract_data = current_item['abstract']
-    condition = current_item['condition']
-    text_to_show = abstract_data[condition]
+    abstract_index, condition = decode(st.session_state.experiment_sequence[index])
+    abstract_id = get_content().ids[abstract_index]
+    render_cache = get_render_cache()
+    
+    # Reading-plus-rating latency starts when this trial is first drawn;
+    # later reruns of the same trial keep the original time.
+    if st.session_state.get('trial_shown', (None,))[0] != index:
+        st.session_state.trial_shown = (index, time.monotonic())
     
     # Progress
-    st.markdown(f"<p class='progress-text'>Abstract {index + 1} of {total}</p>", unsafe_allow_html=True)
+    st.markdown(render_cache.progress_text(index, total), unsafe_allow_html=True)
     st.progress((index) / total)
     
     # Abstract Card
-    st.markdown(f"""
-    <div class='abstract-card'>
-        <div class='abstract-text'>
-            {text_to_show}
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(render_cache.card(abstract_index, condition), unsafe_allow_html=True)
     
     # Questions
     with st.form(key=f"form_{index}"):
         # Removed wrapped question-section div
         
-        st.markdown("<div class='question-header'>Part 1: Assessment</div>", unsafe_allow_html=True)
-        credibility = st.slider("How credible does this research seem?", 1, 7, 4, help="1 = Not at all credible, 7 = Extremely credible")
+        st.markdown(QUESTION_HEADER_1, unsafe_allow_html=True)
+        st.slider("How credible does this research seem?", 1, 7, 4, key=f"credibility_{index}", help="1 = Not at all credible, 7 = Extremely credible")
         st.caption("") # Spacer
-        urgency = st.slider("How urgent is the problem described?", 1, 7, 4, help="1 = Not at all urgent, 7 = Extremely urgent")
+        st.slider("How urgent is the problem described?", 1, 7, 4, key=f"urgency_{index}", help="1 = Not at all urgent, 7 = Extremely urgent")
         
-        st.markdown("<hr style='margin: 2rem 0; border-top: 1px solid #eee;'>", unsafe_allow_html=True)
+        st.markdown(QUESTION_DIVIDER, unsafe_allow_html=True)
         
-        st.markdown("<div class='question-header'>Part 2: Action</div>", unsafe_allow_html=True)
-        policy_support = st.slider("How likely would you be to support policies addressing this issue?", 1, 7, 4, help="1 = Extremely unlikely, 7 = Extremely likely")
+        st.markdown(QUESTION_HEADER_2, unsafe_allow_html=True)
+        st.slider("How likely would you be to support policies addressing this issue?", 1, 7, 4, key=f"policy_support_{index}", help="1 = Extremely unlikely, 7 = Extremely likely")
         st.caption("") # Spacer
-        gov_funding = st.slider("How likely would you be willing to let the Government provide fund to support this project?", 1, 7, 4, help="1 = Extremely unlikely, 7 = Extremely likely")
+        st.slider("How likely would you be willing to let the Government provide fund to support this project?", 1, 7, 4, key=f"gov_funding_{index}", help="1 = Extremely unlikely, 7 = Extremely likely")
         
         # Removed closing div for question-section
         
         st.write("")
-        submitted = st.form_submit_button("Submit Response & Next Abstract")
-        
-        if submitted:
-            # Save response
-            response_data = {
-                "session_id": st.session_state.session_id,
-                "trial_index": index + 1,
-                "abstract_id": abstract_data['id'],
-                "condition": condition,
-                "credibility": credibility,
-                "urgency": urgency,
-                "policy_support": policy_support,
-                "gov_funding": gov_funding,
-                "timestamp": time.time()
-            }
-            st.session_state.responses.append(response_data)
-            
-            # Advance index
-            st.session_state.current_index += 1
-            st.rerun()
-
-    
+        st.form_submit_button(
+            "Submit Response & Next Abstract",
+            on_click=submit_trial,
+            args=(index, abstract_id, condition),
+        )
 
-
-def save_to_gsheets(data_list):
+def commit_session(session_id):
+    """
+    Hands the logged trials of a finished session to the write-behind
+    queue and marks the session complete.
+    """
     try:
-        conn = st.connection("gsheets", type=GSheetsConnection)
-        # Read existing data
-        # We need to handle the case where the sheet is empty or has different columns
-        # But for simplicity, we just append. 
-        # Note: In a real high-concurrency scenario, this might have race conditions, 
-        # but for a simple Streamlit app it's usually acceptable.
-        
-        existing_data = conn.read(worksheet="Sheet1", ttl=0)
-        
-        # Create new rows DataFrame
-        new_rows = pd.DataFrame(data_list)
-        
-        # Append
-        if existing_data.empty:
-            updated_data = new_rows
-        else:
-            updated_data = pd.concat([existing_data, new_rows], ignore_index=True)
-        
-        # Update Google Sheet
-        conn.update(worksheet="Sheet1", data=updated_data)
+        log = get_session_log()
+        # A reload may reach another replica mid-commit; commit only once
+        with get_coordinator().lock(f"commit:{session_id}"):
+            if log.status(session_id) != 'complete':
+                with time_block("survey_commit_seconds"):
+                    # put() skips trials it has already spooled, so a retry
+                    # after mark_complete failed doesn't write them twice
+                    rows = log.session_rows(session_id)
+                    get_writer().put(rows + [status_row(session_id, 'complete')])
+                    log.mark_complete(session_id)
         return True
     except Exception as e:
         st.error(f"Error saving data: {repr(e)}")
         return False
 
+@timed("survey_page_seconds", page="debrief")
 def show_debrief():
     st.title("Thank You")
     
@@ -316,7 +517,7 @@ def show_debrief():
         
     if not st.session_state.saved:
         with st.spinner("Saving your responses..."):
-            success = save_to_gsheets(st.session_state.responses)
+            success = commit_session(st.session_state.session_id)
             if success:
                 st.session_state.saved = True
                 st.success("Your responses have been recorded.")
@@ -337,3 +538,7 @@ elif st.session_state.page == 'experiment':
     show_experiment()
 elif st.session_state.page == 'debrief':
     show_debrief()
+
+# Full script runs only; runs cut short by st.rerun() and fragment-only
+# reruns are not counted here (fragments report under survey_page_seconds)
+REGISTRY.histogram("survey_script_run_seconds").observe(time.perf_counter() - _run_started)
@@ -0,0 +1,170 @@
+"""
+Correctness checks for properties the timing benchmarks don't cover.
+
+    python benchmarks/checks.py                   # run every check
+    python benchmarks/checks.py --only spacing    # run a subset (substring match)
+
+Each check raises AssertionError with what it found; the run fails
+(exit status 1) if any check does.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import traceback
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from content import ABSTRACTS
+from content_store import ContentStore
+from coordination import LocalRedis, RedisCoordinator
+from idempotency import row_key
+from scheduler import AssignmentScheduler
+from sequence import decode
+from storage import SQLiteStore
+from writer import WriteBehindQueue
+
+
+def version_gaps(sequences):
+    """
+    Trials between the two versions of each abstract, over all sequences.
+    """
+    gaps = []
+    for codes in sequences:
+        positions = {}
+        for position, code in enumerate(codes):
+            positions.setdefault(decode(code)[0], []).append(position)
+        gaps.extend(p[-1] - p[0] for p in positions.values())
+    return gaps
+
+
+# --- Checks ---
+
+def check_scheduler_spacing(sessions=400):
+    # A participant shouldn't see an abstract's second version right after
+    # its first: at most 1% of pairs within 5 trials (a random shuffle of
+    # 40 trials puts about 23% there), none back to back
+    content = ContentStore.from_records(ABSTRACTS)
+    scheduler = AssignmentScheduler(content, rng=random.Random(0))
+    gaps = version_gaps(scheduler.assign() for _ in range(sessions))
+    close = sum(1 for g in gaps if g <= 5) / len(gaps)
+    assert min(gaps) > 1, f"two versions shown back to back (min gap {min(gaps)})"
+    assert close <= 0.01, f"{close:.1%} of pairs within 5 trials"
+
+
+def check_scheduler_positions(rounds=5):
+    # Slots are (category, exposure rank); over n consecutive sessions the
+    # Latin square shows every slot once at each position, so every
+    # position holds each category per_category times. A shuffled order
+    # only gets that by chance.
+    content = ContentStore.from_records(ABSTRACTS)
+    scheduler = AssignmentScheduler(content, rng=random.Random(0))
+    n = scheduler.per_category * len(content.by_category)
+    for _ in range(rounds):
+        counts = {}
+        for codes in (scheduler.assign() for _ in range(n)):
+            for position, code in enumerate(codes[:n]):
+                category = content.categories[decode(code)[0]]
+                counts[position, category] = counts.get((position, category), 0) + 1
+        uneven = {k: v for k, v in counts.items() if v != scheduler.per_category}
+        assert not uneven, f"positions not balanced across categories: {sorted(uneven.items())[:5]}"
+
+
+def check_writer_rollback():
+    # A put that fails must not claim its trials: retrying it has to spool them
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteStore(os.path.join(tmp, "responses.db"))
+        writer = WriteBehindQueue(store, spool_path=os.path.join(tmp, "spool.db"))
+        row = {"session_id": "s", "trial_index": 1, "credibility": 4}
+
+        # Row that can't be serialised
+        try:
+            writer.put([dict(row, extra=object())])
+            raise AssertionError("unserialisable row was accepted")
+        except TypeError:
+            pass
+        assert writer.put([row]) == 1, "retry after a failed put was dropped as a duplicate"
+
+        # Spool insert that fails after the claim (as with "database is locked")
+        writer._conn.execute(
+            "CREATE TEMP TRIGGER fail BEFORE INSERT ON spool BEGIN SELECT RAISE(ABORT, 'spool unavailable'); END"
+        )
+        failing = dict(row, trial_index=2)
+        try:
+            writer.put([failing])
+            raise AssertionError("put succeeded although the spool insert failed")
+        except sqlite3.IntegrityError:
+            pass
+        writer._conn.execute("DROP TRIGGER fail")
+        assert not writer._conn.in_transaction, "failed put left its transaction open"
+        assert row_key(failing) not in writer._index.bloom, "rolled-back claim was added to the Bloom filter"
+        assert writer.put([failing]) == 1, "retry after a failed spool insert was dropped"
+        assert writer.pending() == 2, f"{writer.pending()} rows pending, expected 2"
+        assert writer.put([row, failing]) == 0, "duplicates were spooled"
+
+
+def check_writer_shared_claims():
+    # Replicas on different hosts have separate spools; a trial one of them
+    # spooled must be dropped by the others, through the coordinator
+    with tempfile.TemporaryDirectory() as tmp:
+        coordinator = RedisCoordinator(LocalRedis())
+        store = SQLiteStore(os.path.join(tmp, "responses.db"))
+        a, b = (WriteBehindQueue(store, spool_path=os.path.join(tmp, f"spool-{host}.db"), coordinator=coordinator)
+                for host in "ab")
+        rows = [{"session_id": "s", "trial_index": t, "credibility": 4} for t in range(1, 4)]
+        assert a.put(rows[:2]) == 2
+        assert b.put(rows) == 1, "trials spooled on another replica were spooled again"
+        assert a.put(rows) == 0
+
+        # A claim whose spool write rolled back is given back
+        b._conn.execute(
+            "CREATE TEMP TRIGGER fail BEFORE INSERT ON spool BEGIN SELECT RAISE(ABORT, 'spool unavailable'); END"
+        )
+        failing = dict(rows[0], trial_index=4)
+        try:
+            b.put([failing])
+            raise AssertionError("put succeeded although the spool insert failed")
+        except sqlite3.IntegrityError:
+            pass
+        assert a.put([failing]) == 1, "rolled-back shared claim was kept"
+
+        # A claim this replica made but never committed (a crash in between) is its own
+        coordinator.claim("rows", [row_key(dict(failing, trial_index=5))], a.replica)
+        assert a.put([dict(failing, trial_index=5)]) == 1, "own uncommitted claim blocked the retry"
+
+
+CHECKS = {
+    "scheduler.spacing": check_scheduler_spacing,
+    "scheduler.positions": check_scheduler_positions,
+    "writer.rollback": check_writer_rollback,
+    "writer.shared_claims": check_writer_shared_claims,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default="")
+    args = parser.parse_args()
+
+    failed = []
+    for name, check in CHECKS.items():
+        if args.only not in name:
+            continue
+        try:
+            check()
+            print(f"ok      {name}")
+        except Exception:
+            failed.append(name)
+            print(f"FAILED  {name}")
+            traceback.print_exc()
+    if failed:
+        print(f"{len(failed)} check(s) failed: {', '.join(failed)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
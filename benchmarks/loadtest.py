@@ -0,0 +1,155 @@
+"""
+Concurrent-participant load test.
+
+Drives N simulated participants through consent -> instructions -> 40
+trial submits -> debrief with streamlit's AppTest, one thread per
+participant, against the in-memory Google Sheets stand-in. Reports
+per-page latency percentiles, rows saved per second and rows lost, for
+each N.
+
+AppTest installs a process-global runtime for each run, so script runs
+are serialised with a lock. Latencies include the wait for that lock,
+which approximates the queueing a single (GIL-bound) server process
+shows as participants are added. The write-behind queue and the Sheets
+stand-in run concurrently in their own threads, as they do in production.
+
+    python benchmarks/loadtest.py --participants 1 10 50 --latency 0.3 --failure-rate 0.05
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+TRIALS = 40
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+_script_lock = threading.Lock()
+
+
+def participant(timings, errors, lock):
+    from streamlit.testing.v1 import AppTest
+
+    def step(page, action=None):
+        t = time.perf_counter()
+        with _script_lock:
+            (action() if action else at).run()
+        elapsed = time.perf_counter() - t
+        if at.exception:
+            raise RuntimeError(at.exception[0].message)
+        with lock:
+            timings.setdefault(page, []).append(elapsed)
+
+    try:
+        at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+        step("consent")
+        step("instructions", at.button[0].click)
+        step("experiment", at.button[0].click)
+        for i in range(TRIALS):
+            page = "debrief" if i == TRIALS - 1 else "submit"
+            step(page, at.button[0].click)
+    except Exception as e:
+        with lock:
+            errors.append(repr(e))
+
+
+def trial_rows(worksheet):
+    """
+    Data rows holding a trial; session status rows leave trial_index empty.
+    """
+    if not worksheet.rows:
+        return 0
+    column = worksheet.rows[0].index("trial_index")
+    return sum(1 for row in worksheet.rows[1:] if len(row) > column and row[column] not in ("", None))
+
+
+def run_round(n, worksheet, drain_timeout):
+    timings, errors, lock = {}, [], threading.Lock()
+    before = trial_rows(worksheet)
+    start = time.perf_counter()
+    threads = [threading.Thread(target=participant, args=(timings, errors, lock)) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    finished = time.perf_counter()
+
+    # Wait for the write-behind queue to drain into the sheet
+    expected = (n - len(errors)) * TRIALS
+    deadline = time.monotonic() + drain_timeout
+    while trial_rows(worksheet) - before < expected and time.monotonic() < deadline:
+        time.sleep(0.05)
+    drained = time.perf_counter()
+    saved = trial_rows(worksheet) - before
+    return {
+        "timings": timings,
+        "errors": errors,
+        "expected": expected,
+        "saved": saved,
+        "lost": expected - saved,
+        "wall": finished - start,
+        "rows_per_s": saved / (drained - start) if saved else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds per simulated Sheets call")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of Sheets calls that fail")
+    parser.add_argument("--drain-timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="survey-loadtest-")
+    os.environ["SURVEY_STORAGE"] = "local-gsheets"
+    os.environ["SURVEY_LOCAL_SHEETS_LATENCY"] = str(args.latency)
+    os.environ["SURVEY_LOCAL_SHEETS_FAILURE_RATE"] = str(args.failure_rate)
+    os.environ["SURVEY_SPOOL_PATH"] = os.path.join(data_dir, "spool.db")
+    os.environ["SURVEY_TRIAL_LOG_PATH"] = os.path.join(data_dir, "trials.db")
+    os.environ["SURVEY_COORD_PATH"] = os.path.join(data_dir, "coord.db")
+    os.environ["SURVEY_AGGREGATES_PATH"] = os.path.join(data_dir, "aggregates.json")
+
+    import logging
+    logging.getLogger("streamlit").setLevel(logging.ERROR)
+    from sheets import local_worksheet
+    worksheet = local_worksheet(
+        "Sheet1", latency=args.latency, failure_rate=args.failure_rate
+    )
+
+    pages = ["consent", "instructions", "experiment", "submit", "debrief"]
+    print(f"Sheets stand-in: latency={args.latency}s failure_rate={args.failure_rate}")
+    print(f"{'N':>4} {'page':<13}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    summary = []
+    for n in args.participants:
+        result = run_round(n, worksheet, args.drain_timeout)
+        for page in pages:
+            values = result["timings"].get(page, [])
+            print(f"{n:>4} {page:<13}"
+                  f"{percentile(values, 50) * 1e3:>9.1f}"
+                  f"{percentile(values, 95) * 1e3:>9.1f}"
+                  f"{percentile(values, 99) * 1e3:>9.1f}")
+        summary.append((n, result))
+
+    print()
+    print(f"{'N':>4}{'wall s':>9}{'rows/s':>9}{'expected':>10}{'saved':>8}{'lost':>6}{'errors':>8}")
+    for n, r in summary:
+        print(f"{n:>4}{r['wall']:>9.1f}{r['rows_per_s']:>9.1f}{r['expected']:>10}"
+              f"{r['saved']:>8}{r['lost']:>6}{len(r['errors']):>8}")
+        for e in r["errors"][:3]:
+            print(f"      error: {e}")
+
+
+if __name__ == "__main__":
+    main()
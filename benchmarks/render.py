@@ -0,0 +1,59 @@
+"""
+Micro-benchmark of the string work done on each experiment-page rerun:
+formatting the progress label and abstract card inline (the original
+code path) versus looking them up in the RenderCache.
+
+    python benchmarks/render.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from content import ABSTRACTS
+from content_store import ContentStore
+from render import CUSTOM_CSS, RenderCache, render_card
+from sequence import generate_experiment_sequence, decode
+
+TOTAL = 40
+
+
+def legacy_rerun(abstract_index, condition, index):
+    # What show_experiment built on every rerun before the cache existed,
+    # plus the escaping the cached cards now apply
+    text_to_show = ABSTRACTS[abstract_index][condition]
+    progress = f"<p class='progress-text'>Abstract {index + 1} of {TOTAL}</p>"
+    card = render_card(text_to_show)
+    return CUSTOM_CSS, progress, card
+
+
+def cached_rerun(cache, abstract_index, condition, index):
+    return CUSTOM_CSS, cache.progress_text(index, TOTAL), cache.card(abstract_index, condition)
+
+
+def main():
+    cache = RenderCache(ContentStore.from_records(ABSTRACTS)).warm()
+    trials = [decode(code) for code in generate_experiment_sequence(ContentStore.from_records(ABSTRACTS))]
+    number = 200
+
+    def run_legacy():
+        for index, (i, condition) in enumerate(trials):
+            legacy_rerun(i, condition, index)
+
+    def run_cached():
+        for index, (i, condition) in enumerate(trials):
+            cached_rerun(cache, i, condition, index)
+
+    build = min(timeit.repeat(lambda: RenderCache(ContentStore.from_records(ABSTRACTS)).warm(), number=10, repeat=3)) / 10
+    legacy = min(timeit.repeat(run_legacy, number=number, repeat=5)) / (number * TOTAL)
+    cached = min(timeit.repeat(run_cached, number=number, repeat=5)) / (number * TOTAL)
+
+    print(f"cache build (once per process): {build * 1e3:8.3f} ms")
+    print(f"per rerun, inline formatting:   {legacy * 1e6:8.3f} us")
+    print(f"per rerun, cached fragments:    {cached * 1e6:8.3f} us")
+    print(f"saved per rerun:                {(legacy - cached) * 1e6:8.3f} us ({legacy / cached:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
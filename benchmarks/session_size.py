@@ -0,0 +1,92 @@
+"""
+Measures the per-session footprint of the experiment sequence and the
+response record, comparing the original list-of-dicts layout with the
+compact array layout stored in session state.
+
+    python benchmarks/session_size.py
+"""
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from content import ABSTRACTS
+from content_store import ContentStore
+from sequence import decode, generate_experiment_sequence
+from sessions import MEASURES, ResponseBuffer
+
+
+def deep_size(obj, shared_ids):
+    """
+    Bytes reachable from `obj`, skipping objects shared by all sessions.
+    """
+    seen = set(shared_ids)
+    stack = [obj]
+    total = 0
+    while stack:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        total += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple)):
+            stack.extend(o)
+        elif hasattr(o, "__slots__"):
+            stack.extend(getattr(o, name) for name in o.__slots__)
+    return total
+
+
+def fake_rows(codes):
+    rows = []
+    for i, code in enumerate(codes):
+        abstract_index, condition = decode(code)
+        row = {
+            "session_id": "0" * 32,
+            "trial_index": i + 1,
+            "abstract_id": ABSTRACTS[abstract_index]["id"],
+            "condition": condition,
+            "timestamp": time.time(),
+        }
+        row.update({m: 1 + (i + j) % 7 for j, m in enumerate(MEASURES)})
+        rows.append(row)
+    return rows
+
+
+def main():
+    # Interned strings and the content table are shared across sessions
+    shared = {id(a) for a in ABSTRACTS}
+    for a in ABSTRACTS:
+        shared.update(id(v) for v in a.values())
+        shared.update(id(k) for k in a.keys())
+    shared.update(id(s) for s in ("war", "neutral", "abstract", "condition"))
+
+    codes = generate_experiment_sequence(ContentStore.from_records(ABSTRACTS))
+    rows = fake_rows(codes)
+    shared.update(id(k) for k in rows[0])
+
+    # Original layout: list of {"abstract": <content dict>, "condition": str}
+    legacy_sequence = []
+    for code in codes:
+        abstract_index, condition = decode(code)
+        legacy_sequence.append({"abstract": ABSTRACTS[abstract_index], "condition": condition})
+    legacy = {"experiment_sequence": legacy_sequence, "responses": rows}
+
+    compact = {
+        "experiment_sequence": codes,
+        "responses": ResponseBuffer.from_rows(len(codes), rows),
+    }
+
+    print(f"{'layout':<10}{'in-memory bytes':>18}{'pickled bytes':>16}")
+    for name, state in (("before", legacy), ("after", compact)):
+        mem = deep_size(state, shared)
+        pickled = len(pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+        print(f"{name:<10}{mem:>18,}{pickled:>16,}")
+
+
+if __name__ == "__main__":
+    main()
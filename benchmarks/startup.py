@@ -0,0 +1,123 @@
+"""
+Cold-start benchmark: how long a fresh process takes to show the consent
+page.
+
+Each sample runs in a new interpreter and reports
+  - import: time to run app.py's top-level imports (streamlit excluded)
+  - first render: the first script run, up to the rendered consent page
+  - total: interpreter start to rendered consent page
+and which heavy modules were already loaded when the page was shown.
+--sessions pre-fills the session log, since the scheduler is seeded from
+it on startup.
+
+    python benchmarks/startup.py --samples 5 --sessions 0 5000
+"""
+import argparse
+import ast
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+APP = os.path.join(ROOT, "app.py")
+HEAVY = ("pandas", "numpy", "gspread", "streamlit_gsheets")
+
+CHILD = r"""
+import json, sys, time
+sys.path.insert(0, ROOT)
+import streamlit
+t = time.perf_counter()
+exec(compile(IMPORTS, "app-imports", "exec"), {})
+imported = time.perf_counter() - t
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file(APP, default_timeout=120)
+t = time.perf_counter()
+at.run()
+render = time.perf_counter() - t
+assert not at.exception, at.exception
+assert any("Research Study Participation" in m.value for m in at.markdown), "consent page not shown"
+print(json.dumps({"import": imported, "render": render,
+                  "loaded": [m for m in HEAVY if m in sys.modules]}))
+"""
+
+
+def top_level_imports():
+    # The import statements at the top level of app.py, minus streamlit
+    # itself, which every variant pays for
+    tree = ast.parse(open(APP).read())
+    lines = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            source = ast.unparse(node)
+            if source != "import streamlit as st":
+                lines.append(source)
+    return "\n".join(lines)
+
+
+def fill_session_log(path, sessions):
+    sys.path.insert(0, ROOT)
+    from content import ABSTRACTS
+    from content_store import ContentStore
+    from scheduler import AssignmentScheduler
+    from sequence import decode
+    from sessions import SessionLog, new_session_id
+
+    content = ContentStore.from_records(ABSTRACTS)
+    scheduler = AssignmentScheduler(content)
+    log = SessionLog(path)
+    for _ in range(sessions):
+        sequence = [decode(code) for code in scheduler.assign()]
+        log.start(new_session_id(), [[content.ids[i], c] for i, c in sequence])
+
+
+def sample(env):
+    child = (f"ROOT = {ROOT!r}\nAPP = {APP!r}\nHEAVY = {HEAVY!r}\n"
+             f"IMPORTS = {top_level_imports()!r}\n" + CHILD)
+    t = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", child], env=env, capture_output=True, text=True)
+    total = time.perf_counter() - t
+    if out.returncode:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1])
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["total"] = total
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=5)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[0, 5000])
+    args = parser.parse_args()
+
+    print(f"{'sessions':>8}  {'import':>9}  {'first render':>12}  {'total':>9}  loaded at first render")
+    for sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ)
+            env.update(
+                SURVEY_STORAGE="local-gsheets",
+                SURVEY_SPOOL_PATH=os.path.join(tmp, "spool.db"),
+                SURVEY_TRIAL_LOG_PATH=os.path.join(tmp, "trials.db"),
+                SURVEY_AGGREGATES_PATH=os.path.join(tmp, "aggregates.json"),
+                SURVEY_COORD_PATH=os.path.join(tmp, "coord.db"),
+            )
+            env.pop("SURVEY_METRICS_PORT", None)
+            fill_session_log(env["SURVEY_TRIAL_LOG_PATH"], sessions)
+            results = []
+            for _ in range(args.samples):
+                # Fresh coordination state, so every sample seeds the scheduler
+                for suffix in ("", "-wal", "-shm", ".lock"):
+                    if os.path.exists(env["SURVEY_COORD_PATH"] + suffix):
+                        os.remove(env["SURVEY_COORD_PATH"] + suffix)
+                results.append(sample(env))
+        med = {k: statistics.median(r[k] for r in results) for k in ("import", "render", "total")}
+        loaded = ", ".join(results[-1]["loaded"]) or "-"
+        print(f"{sessions:>8}  {med['import'] * 1e3:7.0f}ms  {med['render'] * 1e3:10.0f}ms  "
+              f"{med['total'] * 1e3:7.0f}ms  {loaded}")
+
+
+if __name__ == "__main__":
+    main()
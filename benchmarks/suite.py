@@ -0,0 +1,182 @@
+"""
+Micro-benchmark suite for the app's hot paths, with a regression baseline.
+
+    python benchmarks/suite.py                    # compare against baseline.json
+    python benchmarks/suite.py --update-baseline  # record new baseline
+    python benchmarks/suite.py --only save        # run a subset (substring match)
+
+Each benchmark reports the best of several repeats, in seconds per call.
+The run fails (exit status 1) when any benchmark is slower than its
+baseline by more than --threshold (default 2x). Baselines depend on the
+machine; re-record them when moving the suite to new hardware.
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import tempfile
+import timeit
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, ".."))
+
+from content import ABSTRACTS
+from content_store import ContentStore
+from render import RenderCache
+from scheduler import AssignmentScheduler
+from sequence import decode, generate_experiment_sequence
+from sheets import LocalWorksheet, SheetsPool
+from storage import RESPONSE_COLUMNS, GSheetsStore, SQLiteStore
+
+BASELINE_PATH = os.path.join(HERE, "baseline.json")
+SAVE_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+
+def scaled_content(factor):
+    """
+    The real corpus repeated `factor` times under distinct ids.
+    """
+    records = []
+    for n in range(factor):
+        for item in ABSTRACTS:
+            cat, num = item['id'].split('_')
+            records.append(dict(item, id=f"{cat}_{n}x{num}"))
+    return ContentStore.from_records(records)
+
+
+def session_rows(session_id="bench"):
+    rows = []
+    for i in range(40):
+        row = dict.fromkeys(RESPONSE_COLUMNS, 4)
+        row.update(session_id=session_id, trial_index=i + 1, abstract_id="immuno_1",
+                   condition="war", timestamp=0.0)
+        rows.append(row)
+    return rows
+
+
+# --- Benchmarks: each returns a zero-argument callable to time ---
+
+def bench_sequence(factor):
+    content = scaled_content(factor)
+    return lambda: generate_experiment_sequence(content)
+
+
+def bench_scheduler(factor):
+    scheduler = AssignmentScheduler(scaled_content(factor))
+    return scheduler.assign
+
+
+def bench_render():
+    content = ContentStore.from_records(ABSTRACTS)
+    cache = RenderCache(content).warm()
+    trials = [decode(code) for code in generate_experiment_sequence(content)]
+
+    def render_session():
+        # The per-rerun string work of show_trial, for all 40 trials
+        for index, (i, condition) in enumerate(trials):
+            cache.progress_text(index, 40)
+            cache.card(i, condition)
+    return render_session
+
+
+def bench_save_gsheets(existing):
+    ws = LocalWorksheet()
+    ws.rows = [list(RESPONSE_COLUMNS)] + [["x"] * len(RESPONSE_COLUMNS)] * existing
+    store = GSheetsStore(SheetsPool(lambda: ws, rate=1e9, burst=1e9))
+    rows = session_rows()
+
+    def save():
+        # Back to `existing` rows, or every repeat would time a bigger sheet
+        del ws.rows[existing + 1:]
+        store.append(rows)
+    return save
+
+
+def bench_save_sqlite(existing, tmpdir):
+    # Every session needs its own id: the store keeps one row per
+    # (session_id, trial_index) and would ignore repeats
+    store = SQLiteStore(os.path.join(tmpdir, f"bench_{existing}.db"))
+    filler = session_rows()
+    insert = f'INSERT INTO "{store.table}" VALUES ({", ".join("?" for _ in RESPONSE_COLUMNS)})'
+    for n in range(existing // len(filler)):
+        store._conn.executemany(insert, [
+            tuple(f"filler{n}" if c == "session_id" else r[c] for c in RESPONSE_COLUMNS) for r in filler
+        ])
+    store._conn.commit()
+    rows = session_rows()
+    ids = itertools.count()
+
+    def save():
+        session_id = f"bench{next(ids)}"
+        for row in rows:
+            row["session_id"] = session_id
+        store.append(rows)
+    return save
+
+
+def benchmarks(tmpdir):
+    yield "sequence.generate[1x]", lambda: bench_sequence(1)
+    yield "sequence.generate[100x]", lambda: bench_sequence(100)
+    yield "scheduler.assign[1x]", lambda: bench_scheduler(1)
+    yield "scheduler.assign[100x]", lambda: bench_scheduler(100)
+    yield "render.session[40 trials]", bench_render
+    for n in SAVE_SIZES:
+        yield f"save.gsheets[{n} rows]", lambda n=n: bench_save_gsheets(n)
+        yield f"save.sqlite[{n} rows]", lambda n=n: bench_save_sqlite(n, tmpdir)
+
+
+def measure(fn, min_time=0.2, repeat=7):
+    # Pick a loop count that runs for at least min_time, then take the best repeat
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=2.0)
+    parser.add_argument("--only", default="")
+    args = parser.parse_args()
+
+    baseline = {}
+    if os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH) as f:
+            baseline = json.load(f)
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<28}{'time':>12}{'baseline':>12}{'ratio':>8}")
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name, setup in benchmarks(tmpdir):
+            if args.only not in name:
+                continue
+            seconds = measure(setup())
+            results[name] = seconds
+            base = baseline.get(name)
+            ratio = seconds / base if base else float("nan")
+            flag = ""
+            if base and ratio > args.threshold:
+                regressions.append(name)
+                flag = "  REGRESSION"
+            base_text = f"{base * 1e6:>10.1f}us" if base else f"{'-':>12}"
+            print(f"{name:<28}{seconds * 1e6:>10.1f}us{base_text}{ratio:>8.2f}{flag}")
+
+    if args.update_baseline:
+        baseline.update({k: round(v, 9) for k, v in results.items()})
+        with open(BASELINE_PATH, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {BASELINE_PATH}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed more than {args.threshold}x: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import csv
+import json
+import mmap
+import os
+from array import array
+from functools import lru_cache
+
+from sequence import CONDITIONS
+
+
+class ContentError(ValueError):
+    pass
+
+
+def category_of(record):
+    # Explicit category wins; otherwise the id prefix ('immuno_3' -> 'immuno')
+    return record.get('category') or record['id'].split('_')[0]
+
+
+def _validate(record, where):
+    if not record.get('id'):
+        raise ContentError(f"{where}: record has no 'id'")
+    for condition in CONDITIONS:
+        if not record.get(condition):
+            raise ContentError(f"{where}: '{record['id']}' has no '{condition}' text")
+
+
+class ContentStore:
+    """
+    Indexed table of stimulus pairs.
+
+    Only ids and categories are kept in memory; the id and category indexes
+    are built once at load. Stores opened from a JSONL file keep the byte
+    offset of each record and read its texts from a memory map on first
+    use, so startup time and memory do not grow with the size of the texts.
+    """
+
+    def __init__(self):
+        self.ids = []
+        self.categories = []     # position -> category
+        self.index = {}          # id -> position
+        self.by_category = {}    # category -> [positions]
+        self._records = None     # in-memory records (from_records)
+        self._offsets = array('Q')
+        self._lengths = array('I')
+        self._mm = None
+        # Per store, so a dropped store (and its memory map) isn't kept
+        # alive by a cache shared across instances
+        self._load = lru_cache(maxsize=4096)(self._read)
+
+    def _add(self, record, where):
+        _validate(record, where)
+        if record['id'] in self.index:
+            raise ContentError(f"{where}: duplicate id '{record['id']}'")
+        i = len(self.ids)
+        category = category_of(record)
+        self.ids.append(record['id'])
+        self.categories.append(category)
+        self.index[record['id']] = i
+        self.by_category.setdefault(category, []).append(i)
+        return i
+
+    # --- Loading ---
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Wraps an in-memory list of dicts such as content.ABSTRACTS.
+        """
+        store = cls()
+        store._records = list(records)
+        for n, record in enumerate(store._records):
+            store._add(record, f"record {n}")
+        return store
+
+    @classmethod
+    def from_jsonl(cls, path):
+        """
+        Streams a JSONL file (one stimulus object per line) into the index.
+        """
+        store = cls()
+        with open(path, 'rb') as f:
+            offset = 0
+            for lineno, line in enumerate(f, 1):
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        raise ContentError(f"{path}:{lineno}: {e}") from None
+                    store._add(record, f"{path}:{lineno}")
+                    store._offsets.append(offset)
+                    store._lengths.append(len(line))
+                offset += len(line)
+        if store.ids:
+            with open(path, 'rb') as f:
+                store._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return store
+
+    @classmethod
+    def from_csv(cls, path, cache_path=None):
+        """
+        Streams a CSV file with id, war and neutral columns (plus optional
+        title and category) into a JSONL sidecar, then opens that lazily.
+        The sidecar is rebuilt only when the CSV is newer.
+        """
+        cache_path = cache_path or os.path.splitext(path)[0] + '.jsonl'
+        if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+            tmp_path = cache_path + '.tmp'
+            with open(path, newline='', encoding='utf-8') as src, \
+                    open(tmp_path, 'w', encoding='utf-8') as dst:
+                for record in csv.DictReader(src):
+                    dst.write(json.dumps(record) + '\n')
+            os.replace(tmp_path, cache_path)
+        return cls.from_jsonl(cache_path)
+
+    @classmethod
+    def open(cls, path):
+        if path.endswith('.csv'):
+            return cls.from_csv(path)
+        return cls.from_jsonl(path)
+
+    # --- Access ---
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        if self._records is not None:
+            return self._records[i]
+        return self._load(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def _read(self, i):
+        start = self._offsets[i]
+        return json.loads(self._mm[start:start + self._lengths[i]])
+
+    def get(self, abstract_id):
+        return self[self.index[abstract_id]]
+
+    def text(self, i, condition):
+        return self[i][condition]
+
+
+def write_jsonl(records, path):
+    """
+    Writes stimulus records (e.g. content.ABSTRACTS) as JSONL.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
@@ -0,0 +1,362 @@
+import fcntl
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+
+
+class LockTimeout(Exception):
+    pass
+
+
+class Coordinator:
+    """
+    State shared by every replica of the app: named mutual-exclusion locks,
+    hashes of integer counters and sets of claimed keys.
+    """
+
+    def lock(self, name, timeout=30.0):
+        """
+        Context manager holding the lock `name` across all replicas.
+        Raises LockTimeout if it can't be taken within `timeout` seconds.
+        """
+        raise NotImplementedError
+
+    def counters(self, name):
+        """
+        Returns the counter hash `name` as {field: int}.
+        """
+        raise NotImplementedError
+
+    def incr(self, name, deltas):
+        """
+        Atomically adds {field: amount} to the counter hash `name`.
+        """
+        raise NotImplementedError
+
+    def claim(self, name, keys, owner):
+        """
+        Claims `keys` in the set `name` for `owner` and returns a list of
+        booleans: True where the key is now `owner`'s (newly, or claimed
+        by the same owner before). Replicas on one host share a spool and
+        its idempotency index, which already does this, so by default
+        every key is granted.
+        """
+        return [True] * len(keys)
+
+    def unclaim(self, name, keys):
+        """
+        Gives back keys claimed by a write that was rolled back.
+        """
+
+
+# --- File-locked SQLite backend ---
+
+class SQLiteCoordinator(Coordinator):
+    """
+    Coordinator for replicas on one host (or sharing a filesystem with
+    working POSIX locks). Locks are byte-range locks on a lock file, one
+    of `stripes` bytes per lock name, paired with a thread lock per stripe
+    because POSIX locks are held per process; counters live in a SQLite
+    database next to the lock file.
+    """
+
+    def __init__(self, path="coord.db", stripes=1024):
+        self.path = path
+        self.stripes = stripes
+        self._fd = os.open(path + ".lock", os.O_RDWR | os.O_CREAT, 0o644)
+        self._thread_locks = [threading.Lock() for _ in range(stripes)]
+        self._db_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT NOT NULL,
+                    field TEXT NOT NULL,
+                    value INTEGER NOT NULL,
+                    PRIMARY KEY (name, field)
+                ) WITHOUT ROWID
+            """)
+
+    @contextmanager
+    def lock(self, name, timeout=30.0):
+        stripe = zlib.crc32(name.encode()) % self.stripes
+        thread_lock = self._thread_locks[stripe]
+        deadline = time.monotonic() + timeout
+        if not thread_lock.acquire(timeout=timeout):
+            raise LockTimeout(name)
+        try:
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1, stripe)
+                    break
+                except OSError:
+                    if time.monotonic() >= deadline:
+                        raise LockTimeout(name) from None
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+        finally:
+            thread_lock.release()
+
+    def counters(self, name):
+        with self._db_lock:
+            cur = self._conn.execute("SELECT field, value FROM counters WHERE name = ?", (name,))
+            return dict(cur.fetchall())
+
+    def incr(self, name, deltas):
+        with self._db_lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO counters (name, field, value) VALUES (?, ?, ?) "
+                "ON CONFLICT(name, field) DO UPDATE SET value = value + excluded.value",
+                [(name, field, amount) for field, amount in deltas.items()],
+            )
+
+
+# --- Redis backend ---
+
+# Deletes KEYS[1] only while it still holds ARGV[1], in one server-side step
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+class RedisCoordinator(Coordinator):
+    """
+    Coordinator for replicas on several hosts, over a Redis client created
+    with decode_responses=True (or a LocalRedis). Locks are SET NX keys with
+    a lease of `lease` seconds, so a crashed holder can't block the others.
+    """
+
+    def __init__(self, client, prefix="survey:", lease=60.0):
+        self.client = client
+        self.prefix = prefix
+        self.lease = lease
+
+    @contextmanager
+    def lock(self, name, timeout=30.0):
+        key = f"{self.prefix}lock:{name}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        delay = 0.001
+        while not self.client.set(key, token, nx=True, px=int(self.lease * 1000)):
+            if time.monotonic() >= deadline:
+                raise LockTimeout(name)
+            time.sleep(delay)
+            delay = min(delay * 2, 0.05)
+        try:
+            yield
+        finally:
+            # Only release our own lease; it may have expired and been retaken,
+            # so the check and the delete must be one atomic step
+            self.client.eval(RELEASE_SCRIPT, 1, key, token)
+
+    def counters(self, name):
+        return {k: int(v) for k, v in self.client.hgetall(f"{self.prefix}counters:{name}").items()}
+
+    def incr(self, name, deltas):
+        key = f"{self.prefix}counters:{name}"
+        pipe = self.client.pipeline()
+        for field, amount in deltas.items():
+            pipe.hincrby(key, field, amount)
+        pipe.execute()
+
+    def claim(self, name, keys, owner):
+        # Replicas on other hosts have their own spools: the hash of
+        # key -> owner is the only index they all see. A key this owner
+        # already holds was claimed by a write that never committed here
+        # (it crashed in between), so it is granted again.
+        if not keys:
+            return []
+        key = f"{self.prefix}claims:{name}"
+        pipe = self.client.pipeline()
+        for k in keys:
+            pipe.hsetnx(key, k, owner)
+        granted = [bool(r) for r in pipe.execute()]
+        taken = [j for j, ok in enumerate(granted) if not ok]
+        if taken:
+            pipe = self.client.pipeline()
+            for j in taken:
+                pipe.hget(key, keys[j])
+            for j, holder in zip(taken, pipe.execute()):
+                granted[j] = holder == owner
+        return granted
+
+    def unclaim(self, name, keys):
+        if keys:
+            self.client.hdel(f"{self.prefix}claims:{name}", *keys)
+
+
+def redis_client(url):
+    """
+    Connects to the Redis server at `url`. Needs the `redis` package.
+    """
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+class LocalRedis:
+    """
+    In-process stand-in for a redis-py client (decode_responses=True),
+    implementing the commands the coordinator and session log use.
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self._lock = threading.RLock()
+
+    def _live(self, key):
+        expires = self.expires.get(key)
+        if expires is not None and time.monotonic() >= expires:
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        with self._lock:
+            return self.data[key] if self._live(key) else None
+
+    def set(self, key, value, nx=False, px=None):
+        with self._lock:
+            if nx and self._live(key):
+                return None
+            self.data[key] = str(value)
+            self.expires.pop(key, None)
+            if px:
+                self.expires[key] = time.monotonic() + px / 1000
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._live(key):
+                    del self.data[key]
+                    removed += 1
+                self.expires.pop(key, None)
+            return removed
+
+    def exists(self, key):
+        with self._lock:
+            return int(self._live(key))
+
+    def eval(self, script, numkeys, *args):
+        # Only the scripts this module sends, run under the client lock
+        if script != RELEASE_SCRIPT:
+            raise NotImplementedError("LocalRedis only runs RELEASE_SCRIPT")
+        key, token = args[0], args[numkeys]
+        with self._lock:
+            if self._live(key) and self.data[key] == token:
+                return self.delete(key)
+            return 0
+
+    def _hash(self, key):
+        self._live(key)
+        return self.data.setdefault(key, {})
+
+    def hget(self, key, field):
+        with self._lock:
+            return self.data.get(key, {}).get(str(field)) if self._live(key) else None
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self.data[key]) if self._live(key) else {}
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            h = self._hash(key)
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = sum(1 for f in items if str(f) not in h)
+            h.update({str(f): str(v) for f, v in items.items()})
+            return added
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            h = self._hash(key)
+            if str(field) in h:
+                return 0
+            h[str(field)] = str(value)
+            return 1
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            if not self._live(key):
+                return 0
+            h = self.data[key]
+            return sum(1 for f in fields if h.pop(str(f), None) is not None)
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            h = self._hash(key)
+            h[str(field)] = str(int(h.get(str(field), 0)) + amount)
+            return int(h[str(field)])
+
+    def sadd(self, key, *members):
+        with self._lock:
+            self._live(key)
+            s = self.data.setdefault(key, set())
+            before = len(s)
+            s.update(str(m) for m in members)
+            return len(s) - before
+
+    def srem(self, key, *members):
+        with self._lock:
+            if not self._live(key):
+                return 0
+            s = self.data[key]
+            before = len(s)
+            s.difference_update(str(m) for m in members)
+            return before - len(s)
+
+    def smembers(self, key):
+        with self._lock:
+            return set(self.data[key]) if self._live(key) else set()
+
+    def pipeline(self):
+        return _LocalPipeline(self)
+
+
+class _LocalPipeline:
+    # Queues calls and runs them under the client lock on execute()
+
+    def __init__(self, client):
+        self._client = client
+        self._calls = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self._calls.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._client._lock:
+            results = [getattr(self._client, name)(*args, **kwargs) for name, args, kwargs in self._calls]
+        self._calls = []
+        return results
+
+
+# Named in-process servers, shared by everything in the process so tests
+# can run several "replicas" against one.
+LOCAL_REDIS = {}
+_local_lock = threading.Lock()
+
+
+def local_redis(name="default"):
+    with _local_lock:
+        if name not in LOCAL_REDIS:
+            LOCAL_REDIS[name] = LocalRedis()
+        return LOCAL_REDIS[name]
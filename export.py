@@ -0,0 +1,279 @@
+"""
+Incremental Parquet export of the response store.
+
+    python export.py responses.db export/              # append rows added since the last run
+    python export.py Sheet1.csv export/                # same, from a downloaded sheet
+    python export.py responses.db export/ --compact    # then merge small files
+
+Rows are written as typed, zstd-compressed Parquet in a hive-partitioned
+tree, export/study_date=YYYY-MM-DD/category=<category>/part-*.parquet,
+so readers that filter on date or category open only those directories
+and read only the columns they ask for:
+
+    pd.read_parquet("export/", columns=["session_id", "credibility"],
+                    filters=[("category", "==", "immuno")])
+
+Session status records (see sessions.status_row) have no abstract and go
+to category=session.
+
+Progress (the last exported SQLite rowid, or CSV data row) is kept in
+export/_state.json, with the columns the files were written with; when
+SCHEMA gains a column, the next run rewrites older files with it (null)
+so the tree keeps one schema. Each chunk's files are named after the
+first source position they hold, so a run that dies before saving its
+progress is simply redone and overwrites the same files. Compaction
+records each merge in the state file before writing it, and a merge
+interrupted by a crash is finished by the next run.
+"""
+import argparse
+import glob
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from content import ABSTRACTS
+from content_store import ContentStore
+from storage import RESPONSE_COLUMNS
+
+SCHEMA = pa.schema([
+    ("session_id", pa.string()),
+    ("trial_index", pa.int16()),
+    ("abstract_id", pa.dictionary(pa.int32(), pa.string())),
+    ("condition", pa.dictionary(pa.int8(), pa.string())),
+    ("credibility", pa.int8()),
+    ("urgency", pa.int8()),
+    ("policy_support", pa.int8()),
+    ("gov_funding", pa.int8()),
+    ("timestamp", pa.timestamp("ms", tz="UTC")),
+    ("shown_at_mono", pa.float64()),
+    ("submitted_at_mono", pa.float64()),
+    ("response_ms", pa.float32()),
+    ("session_status", pa.dictionary(pa.int8(), pa.string())),
+])
+assert SCHEMA.names == RESPONSE_COLUMNS
+
+STATE_FILE = "_state.json"
+
+
+def category_map(content=None):
+    content = content or ContentStore.from_records(ABSTRACTS)
+    return dict(zip(content.ids, content.categories))
+
+
+# --- Sources ---
+# Each yields (first position, last position, DataFrame) in source order,
+# starting after `after`.
+
+def sqlite_chunks(path, after=0, chunksize=100_000, table="responses"):
+    import sqlite3
+    columns = ", ".join(f'"{c}"' for c in RESPONSE_COLUMNS)
+    with sqlite3.connect(path) as conn:
+        query = f'SELECT rowid AS _pos, {columns} FROM "{table}" WHERE rowid > ? ORDER BY rowid'
+        for df in pd.read_sql_query(query, conn, params=(after,), chunksize=chunksize):
+            if df.empty:
+                continue
+            yield int(df["_pos"].iloc[0]), int(df["_pos"].iloc[-1]), df.drop(columns="_pos")
+
+
+def csv_chunks(path, after=0, chunksize=100_000):
+    # A downloaded sheet is append-only, so data row numbers are stable
+    reader = pd.read_csv(path, skiprows=range(1, after + 1), chunksize=chunksize)
+    pos = after
+    for df in reader:
+        yield pos + 1, pos + len(df), df.reindex(columns=RESPONSE_COLUMNS)
+        pos += len(df)
+
+
+# --- Writing ---
+
+def to_table(df):
+    """
+    Casts a frame of response rows to SCHEMA.
+    """
+    df = df.copy()
+    for c in ("trial_index", "credibility", "urgency", "policy_support", "gov_funding"):
+        df[c] = pd.to_numeric(df[c], errors="coerce").round().astype("Int64")
+    for c in ("shown_at_mono", "submitted_at_mono", "response_ms"):
+        df[c] = pd.to_numeric(df[c], errors="coerce")
+    # SCHEMA stores milliseconds; Arrow won't drop the sub-ms part itself
+    df["timestamp"] = pd.to_datetime(pd.to_numeric(df["timestamp"], errors="coerce"), unit="s", utc=True).dt.floor("ms")
+    for c in ("session_id", "abstract_id", "condition", "session_status"):
+        df[c] = df[c].astype("string")
+    return pa.Table.from_pandas(df[RESPONSE_COLUMNS], schema=SCHEMA, preserve_index=False)
+
+
+def _partition_dir(root, study_date, category):
+    return os.path.join(root, f"study_date={study_date}", f"category={category}")
+
+
+def write_chunk(root, df, first, categories):
+    """
+    Writes one Parquet file per (study date, category) present in `df`.
+    Returns the number of files written.
+    """
+    stamps = pd.to_datetime(pd.to_numeric(df["timestamp"], errors="coerce"), unit="s", utc=True)
+    category = df["abstract_id"].map(categories).fillna(
+        df["abstract_id"].astype(str).str.split("_", n=1).str[0])
+    keys = pd.DataFrame({
+        "study_date": stamps.dt.strftime("%Y-%m-%d").fillna("unknown"),
+        # Session status records have no abstract
+        "category": category.where(df["abstract_id"].notna(), "session"),
+    })
+    files = 0
+    for (study_date, category), rows in df.groupby([keys["study_date"], keys["category"]], sort=False):
+        directory = _partition_dir(root, study_date, category)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{first:012d}.parquet")
+        tmp = os.path.join(directory, f"_part-{first:012d}.tmp")
+        pq.write_table(to_table(rows), tmp, compression="zstd")
+        os.replace(tmp, path)
+        files += 1
+    return files
+
+
+class Exporter:
+    """
+    Appends rows the source has gained since the last run to the Parquet
+    tree under `root`.
+    """
+
+    def __init__(self, source, root, categories=None, chunksize=100_000):
+        self.source = os.path.abspath(source)
+        self.root = root
+        self.categories = categories if categories is not None else category_map()
+        self.chunksize = chunksize
+        os.makedirs(root, exist_ok=True)
+        self.state_path = os.path.join(root, STATE_FILE)
+
+    def _state(self):
+        if not os.path.exists(self.state_path):
+            return {"source": self.source, "last": 0, "columns": SCHEMA.names}
+        with open(self.state_path) as f:
+            state = json.load(f)
+        if state.get("source") != self.source:
+            raise ValueError(f"{self.root} was exported from {state.get('source')}, not {self.source}")
+        return state
+
+    def _save_state(self, state):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.state_path)
+
+    def run(self):
+        """
+        Exports new rows. Returns (rows, files) written.
+        """
+        state = self._state()
+        self._finish_compaction(state)
+        if state.get("columns") != SCHEMA.names:
+            self._upgrade()
+            state["columns"] = SCHEMA.names
+            self._save_state(state)
+        chunks = csv_chunks if self.source.endswith(".csv") else sqlite_chunks
+        rows = files = 0
+        for first, last, df in chunks(self.source, state["last"], self.chunksize):
+            files += write_chunk(self.root, df, first, self.categories)
+            rows += len(df)
+            state["last"] = last
+            self._save_state(state)
+        return rows, files
+
+    def _upgrade(self):
+        # Rewrites files from an older SCHEMA with the missing columns as nulls
+        for path in glob.glob(os.path.join(self.root, "study_date=*", "category=*", "part-*.parquet")):
+            table = pq.read_table(path)
+            if table.schema.names == SCHEMA.names:
+                continue
+            for field in SCHEMA:
+                if field.name not in table.schema.names:
+                    table = table.append_column(field, pa.nulls(len(table), field.type))
+            tmp = path[:-len(".parquet")] + ".tmp"
+            pq.write_table(table.select(SCHEMA.names).cast(SCHEMA), tmp, compression="zstd")
+            os.replace(tmp, path)
+
+    def _finish_compaction(self, state):
+        # Completes (or abandons) a merge interrupted by a crash. The merge
+        # is recorded before its file is written, so: merged file present,
+        # the files it replaces go; absent, they are still the only copy
+        pending = state.pop("compacting", None)
+        if pending is None:
+            return
+        if os.path.exists(os.path.join(self.root, pending["merged"])):
+            for name in pending["replaces"]:
+                path = os.path.join(self.root, name)
+                if os.path.exists(path):
+                    os.remove(path)
+        self._save_state(state)
+
+    def compact(self, min_files=8, target_rows=1_000_000):
+        """
+        Merges the files of any partition that has at least `min_files`,
+        in source order, into files of up to `target_rows` rows.
+        Returns the number of partitions compacted.
+        """
+        state = self._state()
+        self._finish_compaction(state)
+        compacted = 0
+        for directory in sorted(glob.glob(os.path.join(self.root, "study_date=*", "category=*"))):
+            parts = sorted(glob.glob(os.path.join(directory, "part-*.parquet")))
+            if len(parts) < min_files:
+                continue
+            # Group consecutive files up to target_rows; each group becomes
+            # one file named after the first and last file it holds
+            groups, current, size = [], [], 0
+            for path in parts:
+                n = pq.ParquetFile(path).metadata.num_rows
+                if current and size + n > target_rows:
+                    groups.append(current)
+                    current, size = [], 0
+                current.append(path)
+                size += n
+            groups.append(current)
+            merged_any = False
+            for group in groups:
+                if len(group) < 2:
+                    continue
+                first = os.path.basename(group[0]).split("-")[1].split(".")[0]
+                last = os.path.basename(group[-1]).split("-")[-1].split(".")[0]
+                merged = os.path.join(directory, f"part-{first}-{last}.parquet")
+                # 1. Record the merge, 2. write the merged file, 3. drop the
+                #    files it replaces, 4. clear the record
+                state["compacting"] = {
+                    "merged": os.path.relpath(merged, self.root),
+                    "replaces": [os.path.relpath(p, self.root) for p in group],
+                }
+                self._save_state(state)
+                table = pa.concat_tables([pq.read_table(p, schema=SCHEMA) for p in group])
+                tmp = os.path.join(directory, "_compact.tmp")
+                pq.write_table(table, tmp, compression="zstd")
+                os.replace(tmp, merged)
+                self._finish_compaction(state)
+                merged_any = True
+            compacted += merged_any
+        return compacted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="SQLiteStore database or CSV download of the sheet")
+    parser.add_argument("root", nargs="?", default="export")
+    parser.add_argument("--compact", action="store_true", help="merge small files after exporting")
+    parser.add_argument("--min-files", type=int, default=8)
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    args = parser.parse_args()
+
+    content_path = os.environ.get("SURVEY_CONTENT_PATH")
+    content = ContentStore.open(content_path) if content_path else None
+    exporter = Exporter(args.source, args.root, category_map(content), args.chunksize)
+    rows, files = exporter.run()
+    print(f"exported {rows} row(s) to {files} file(s)")
+    if args.compact:
+        print(f"compacted {exporter.compact(args.min_files)} partition(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import hashlib
+import math
+import sqlite3
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over string keys: `key in bf` is never False
+    for an added key, and True for other keys with probability about
+    `error_rate` while no more than `capacity` keys have been added.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+
+def row_key(row):
+    """
+    Idempotency key of a response row, or None if it has no trial key.
+    A session status record (no trial_index) is keyed by its status, so
+    each status is stored once per session whatever its trials' keys.
+    """
+    if row.get("session_id") is None:
+        return None
+    if row.get("trial_index") is None:
+        if row.get("session_status") is None:
+            return None
+        return f"{row['session_id']}\x1fstatus:{row['session_status']}"
+    return f"{row['session_id']}\x1f{row['trial_index']}"
+
+
+class IdempotencyIndex:
+    """
+    Persistent set of claimed keys in a SQLite table, with an in-memory
+    Bloom filter in front. A key the filter has never seen is new without
+    a lookup, so the common case is a single batched insert; only keys the
+    filter reports (real repeats and the ~1% false positives) are checked
+    against the table.
+
+    `claim` must run inside a transaction the caller has opened on `conn`
+    (BEGIN), so claiming a key commits or rolls back together with
+    whatever it guards; once that transaction has committed, the caller
+    passes the claimed keys to `remember` to add them to the filter.
+    Another process sharing the table (a replica sharing the spool) can
+    claim keys this filter hasn't seen; the primary key catches those.
+    """
+
+    def __init__(self, conn, table="seen", capacity=1_000_000, error_rate=0.01):
+        self.conn = conn
+        self.table = table
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (key TEXT PRIMARY KEY) WITHOUT ROWID')
+        existing = conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+        self.bloom = BloomFilter(max(capacity, 2 * existing), error_rate)
+        for (key,) in conn.execute(f'SELECT key FROM "{table}"'):
+            self.bloom.add(key)
+
+    def claim(self, keys):
+        """
+        Records `keys` and returns a list of booleans: True where the key
+        was not claimed before (None keys are always True). Runs inside the
+        caller's open transaction.
+        """
+        if not self.conn.in_transaction:
+            raise RuntimeError("IdempotencyIndex.claim needs an open transaction")
+        fresh = [False] * len(keys)
+        maybe, unseen, batch = [], [], set()
+        for j, key in enumerate(keys):
+            if key is None:
+                fresh[j] = True
+            elif key not in batch:
+                batch.add(key)
+                (maybe if key in self.bloom else unseen).append(j)
+
+        insert = f'INSERT OR IGNORE INTO "{self.table}" (key) VALUES (?)'
+        for j in maybe:
+            fresh[j] = self.conn.execute(insert, (keys[j],)).rowcount == 1
+        if unseen:
+            self.conn.execute("SAVEPOINT claim")
+            try:
+                self.conn.executemany(f'INSERT INTO "{self.table}" (key) VALUES (?)', [(keys[j],) for j in unseen])
+                for j in unseen:
+                    fresh[j] = True
+            except sqlite3.IntegrityError:
+                # Claimed by another process since our filter was built
+                self.conn.execute("ROLLBACK TO claim")
+                for j in unseen:
+                    fresh[j] = self.conn.execute(insert, (keys[j],)).rowcount == 1
+            self.conn.execute("RELEASE claim")
+        return fresh
+
+    def remember(self, keys):
+        """
+        Adds keys whose claim has committed to the Bloom filter. A claim
+        that was rolled back must not be remembered: the filter would
+        still be correct, but every later put of those keys would pay for
+        a lookup.
+        """
+        for key in keys:
+            if key is not None:
+                self.bloom.add(key)
@@ -0,0 +1,274 @@
+"""
+Manipulation strength of the war/neutral stimulus pairs.
+
+    python manipulation.py                       # content.py
+    python manipulation.py --content stimuli.jsonl --cache manipulation.db
+
+For each pair the two texts are tokenized and aligned, giving the word
+edits that turn the neutral text into the war text. Alongside that:
+war-lexicon hits in each version, word and character counts, and Flesch
+reading ease, with war - neutral deltas. Lexicon, length and readability
+are counted with pandas string methods over the whole batch at once.
+
+Results are cached by a hash of the pair's texts (and the lexicon), so a
+rerun only analyses pairs that were added or edited.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from content_store import ContentStore
+
+# War and conflict vocabulary: a token matches if it starts with one of
+# WAR_STEMS or equals one of WAR_WORDS (short words that are also the
+# start of unrelated ones: war/warm, ally/allyl)
+WAR_STEMS = (
+    "ammunition", "annihilat", "armament", "arsenal", "assault", "attack", "barrage",
+    "battl", "blitz", "bomb", "campaign", "casualt", "combat", "command", "conflict",
+    "conquer", "counterattack", "defeat", "defen", "deploy", "destroy", "enem",
+    "eradicat", "fight", "fortif", "frontline", "front-line", "guerrilla", "hostil",
+    "invad", "invasion", "kill", "lethal", "militar", "mobiliz", "munition",
+    "offensive", "onslaught", "regiment", "retaliat", "sabotag", "siege", "soldier",
+    "strateg", "strike", "surrender", "tactic", "troop", "victor", "warfare",
+    "warrior", "wartime", "weapon",
+)
+WAR_WORDS = ("allies", "ally", "armies", "army", "war", "wars")
+LEXICON_VERSION = hashlib.sha256(" ".join(WAR_STEMS + WAR_WORDS).encode()).hexdigest()[:12]
+
+
+def _trie(words):
+    # One alternation per shared prefix; Python's regex engine tries a
+    # flat alternation of n words at every position, a trie only one path
+    root = {}
+    for word in words:
+        node = root
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+    def build(node):
+        optional = "" in node
+        alts = [re.escape(ch) + build(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if optional else body
+    return build(root)
+
+
+WORD = r"[A-Za-z][A-Za-z'\-]*"
+_TOKEN = re.compile(rf"{WORD}|\d+(?:\.\d+)?")
+# Both run on lowercased text
+_STEMS = r"\b" + _trie(WAR_STEMS)
+_WORDS = r"\b" + _trie(WAR_WORDS) + r"\b"
+
+COLUMNS = [
+    "words_war", "words_neutral", "chars_war", "chars_neutral",
+    "lexicon_war", "lexicon_neutral", "reading_ease_war", "reading_ease_neutral",
+    "edits", "changed_war", "changed_neutral", "changed_share",
+]
+
+
+def pair_hash(record):
+    text = json.dumps([record["war"], record["neutral"], LEXICON_VERSION])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def tokenize(text):
+    return [t.lower() for t in _TOKEN.findall(text)]
+
+
+def word_diff(war, neutral):
+    """
+    Aligns the token sequences of a pair. Returns (edits, changed_war,
+    changed_neutral, spans), where spans lists (neutral words, war words)
+    for each replaced, inserted or deleted run.
+    """
+    a, b = tokenize(neutral), tokenize(war)
+    spans = []
+    changed_war = changed_neutral = 0
+    for op, i1, i2, j1, j2 in SequenceMatcher(None, a, b, autojunk=False).get_opcodes():
+        if op != "equal":
+            spans.append((" ".join(a[i1:i2]), " ".join(b[j1:j2])))
+            changed_neutral += i2 - i1
+            changed_war += j2 - j1
+    return len(spans), changed_war, changed_neutral, spans
+
+
+def _diff_batch(pairs):
+    # Runs in a worker process for large batches
+    return [word_diff(war, neutral) for war, neutral in pairs]
+
+
+def text_metrics(texts):
+    """
+    Word, character, war-lexicon and Flesch reading-ease counts for a
+    Series of texts, one vectorized pass per measure.
+    """
+    words = texts.str.count(WORD).to_numpy(dtype=float)
+    sentences = np.maximum(texts.str.count(r"[.!?]+(?:\s|$)").to_numpy(dtype=float), 1)
+    # Syllables: vowel groups, minus a silent final e, at least one per word
+    lower = texts.str.lower()
+    syllables = (lower.str.count(r"[aeiouy]+") - lower.str.count(r"[^aeiouy\W]e\b")).to_numpy(dtype=float)
+    syllables = np.maximum(syllables, words)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ease = 206.835 - 1.015 * (words / sentences) - 84.6 * (syllables / words)
+    return {
+        "words": words,
+        "chars": texts.str.len().to_numpy(dtype=float),
+        "lexicon": (lower.str.count(_STEMS) + lower.str.count(_WORDS)).to_numpy(dtype=float),
+        "reading_ease": ease,
+    }
+
+
+def analyze_pairs(records, workers=None):
+    """
+    Returns one row per record (indexed by id) with the per-version
+    counts in COLUMNS plus the word-edit spans.
+    """
+    frame = pd.DataFrame.from_records(
+        [{"id": r["id"], "war": r["war"], "neutral": r["neutral"]} for r in records],
+        columns=["id", "war", "neutral"],
+    )
+    out = pd.DataFrame(index=pd.Index(frame["id"], name="id"))
+    for version in ("war", "neutral"):
+        for name, values in text_metrics(frame[version].astype(str)).items():
+            out[f"{name}_{version}"] = values
+
+    pairs = list(zip(frame["war"], frame["neutral"]))
+    workers = workers or os.cpu_count() or 1
+    if len(pairs) >= 2000 and workers > 1:
+        size = -(-len(pairs) // (4 * workers))
+        batches = [pairs[i:i + size] for i in range(0, len(pairs), size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            diffs = [d for batch in pool.map(_diff_batch, batches) for d in batch]
+    else:
+        diffs = _diff_batch(pairs)
+    edits, changed_war, changed_neutral, spans = zip(*diffs) if diffs else ((),) * 4
+    out["edits"] = np.asarray(edits, dtype=float)
+    out["changed_war"] = np.asarray(changed_war, dtype=float)
+    out["changed_neutral"] = np.asarray(changed_neutral, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out["changed_share"] = out["changed_war"] / out["words_war"]
+    out["spans"] = list(spans)
+    return out
+
+
+def add_deltas(df):
+    """
+    Adds war - neutral deltas and lexicon hits per 100 words.
+    """
+    df = df.copy()
+    for name in ("words", "chars", "lexicon", "reading_ease"):
+        df[f"{name}_delta"] = df[f"{name}_war"] - df[f"{name}_neutral"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["strength"] = 100 * (df["lexicon_war"] / df["words_war"] - df["lexicon_neutral"] / df["words_neutral"])
+    return df
+
+
+class ManipulationCache:
+    """
+    Analysis results keyed by pair hash in a SQLite file. `analyze` looks
+    every pair up and only analyses the ones it hasn't seen.
+    """
+
+    def __init__(self, path="manipulation.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS pairs (hash TEXT PRIMARY KEY, result TEXT NOT NULL)")
+
+    def _lookup(self, hashes):
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), 500):
+            chunk = unique[start:start + 500]
+            marks = ", ".join("?" for _ in chunk)
+            cur = self._conn.execute(f"SELECT hash, result FROM pairs WHERE hash IN ({marks})", chunk)
+            found.update((h, json.loads(r)) for h, r in cur)
+        return found
+
+    def analyze(self, records, workers=None):
+        """
+        Returns add_deltas(analyze_pairs(records)) with cached rows reused.
+        Also returns the number of pairs that had to be analysed.
+        """
+        records = list(records)
+        hashes = [pair_hash(r) for r in records]
+        cached = self._lookup(hashes)
+        missing = [r for r, h in zip(records, hashes) if h not in cached]
+        if missing:
+            fresh = analyze_pairs(missing, workers)
+            new = {}
+            for record, row in zip(missing, fresh[COLUMNS + ["spans"]].to_dict("records")):
+                new[pair_hash(record)] = {k: (None if isinstance(v, float) and np.isnan(v) else v)
+                                          for k, v in row.items()}
+            with self._conn:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO pairs (hash, result) VALUES (?, ?)",
+                    [(h, json.dumps(row)) for h, row in new.items()],
+                )
+            cached.update(new)
+        df = pd.DataFrame.from_records([cached[h] for h in hashes], columns=COLUMNS + ["spans"])
+        df[COLUMNS] = df[COLUMNS].astype(float)
+        df.index = pd.Index([r["id"] for r in records], name="id")
+        return add_deltas(df), len(missing)
+
+    def close(self):
+        self._conn.close()
+
+
+def summarize(df):
+    """
+    Corpus-level consistency: mean, SD and range of each delta, and the
+    pairs whose war version adds no war vocabulary.
+    """
+    deltas = ["strength", "lexicon_delta", "words_delta", "chars_delta", "reading_ease_delta", "changed_share"]
+    summary = df[deltas].agg(["mean", "std", "min", "max"]).T
+    weak = df.index[df["lexicon_delta"] <= 0].tolist()
+    return summary, weak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--content", default=os.environ.get("SURVEY_CONTENT_PATH"),
+                        help="JSONL or CSV stimulus file (default: content.py)")
+    parser.add_argument("--cache", default="manipulation.db")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--spans", action="store_true", help="print the word edits of every pair")
+    args = parser.parse_args()
+
+    if args.content:
+        content = ContentStore.open(args.content)
+    else:
+        from content import ABSTRACTS
+        content = ContentStore.from_records(ABSTRACTS)
+    cache = ManipulationCache(args.cache)
+    df, analysed = cache.analyze(content, args.workers)
+    print(f"{len(df)} pair(s), {analysed} analysed, {len(df) - analysed} from cache")
+
+    summary, weak = summarize(df)
+    columns = ["strength", "lexicon_war", "lexicon_neutral", "words_delta", "reading_ease_delta", "edits"]
+    with pd.option_context("display.width", 120, "display.max_rows", 500):
+        print("\n== per pair ==")
+        print(df[columns].sort_values("strength").round(2).to_string())
+        print("\n== corpus ==")
+        print(summary.round(3).to_string())
+    if weak:
+        print(f"\nno added war vocabulary: {', '.join(weak)}")
+    if args.spans:
+        for abstract_id, spans in df["spans"].items():
+            print(f"\n{abstract_id}")
+            for neutral, war in spans:
+                print(f"  {neutral or '-'!s:>30} -> {war or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+# Upper bounds in seconds, from 0.5 ms to 30 s
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. `observe` is one bisect and three
+    increments under a lock, cheap enough for every rerun.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Registry:
+    """
+    Process-wide metrics: histograms and counters keyed by name and labels,
+    plus gauges that are read from a callback when exported.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.help = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        h = self.histograms.get(key)
+        if h is None:
+            with self._lock:
+                h = self.histograms.setdefault(key, Histogram())
+        return h
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, fn, help=""):
+        self.gauges[name] = fn
+        if help:
+            self.help[name] = help
+
+    @contextmanager
+    def time(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.histogram(name, **labels).observe(time.perf_counter() - start)
+
+    def timed(self, name, **labels):
+        """
+        Decorator form of `time`.
+        """
+        def decorator(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                with self.time(name, **labels):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def render(self):
+        """
+        Returns all metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        described = set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                if name in self.help:
+                    lines.append(f"# HELP {name} {self.help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), h in sorted(self.histograms.items()):
+            header(name, "histogram")
+            with h._lock:
+                counts, total, count = list(h.counts), h.sum, h.count
+            running = 0
+            for bound, n in zip(h.buckets + (float("inf"),), counts):
+                running += n
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {running}")
+            lines.append(f"{name}_sum{_label_text(labels)} {total}")
+            lines.append(f"{name}_count{_label_text(labels)} {count}")
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, "counter")
+            lines.append(f"{name}{_label_text(labels)} {value}")
+        for name, fn in sorted(self.gauges.items()):
+            header(name, "gauge")
+            try:
+                value = fn()
+            except Exception:
+                continue
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+REGISTRY.help.update({
+    "survey_page_seconds": "Time spent rendering each page",
+    "survey_script_run_seconds": "Full script rerun time",
+    "survey_sequence_seconds": "Time to assign a new session's sequence",
+    "survey_session_log_seconds": "Session log round-trips",
+    "survey_commit_seconds": "Debrief commit time (spool write and status update)",
+    "survey_spool_write_seconds": "Write-behind spool write time",
+    "survey_store_append_seconds": "Response store append time per batch",
+    "survey_store_errors_total": "Failed response store appends",
+    "survey_rows_flushed_total": "Rows flushed to the response store",
+    "survey_duplicate_rows_total": "Rows dropped because their (session, trial) was already spooled",
+    "survey_sessions_abandoned_total": "Idle sessions whose partial responses were flushed",
+    "survey_sessions_recovered_total": "Idle sessions on the debrief page committed by the reaper",
+    "survey_sessions_released_total": "Idle sessions whose in-memory state was released",
+})
+time_block = REGISTRY.time
+timed = REGISTRY.timed
+
+
+def serve(port, registry=REGISTRY, host="0.0.0.0", routes=None):
+    """
+    Serves `registry` as text/plain on http://host:port/metrics from a
+    daemon thread, for Prometheus to scrape.
+
+    `routes` maps further paths to functions taking the query parameters
+    and returning (status, content type, iterable of bytes); the body is
+    written as it is produced.
+    """
+    routes = routes or {}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path in routes:
+                params = {k: v[-1] for k, v in parse_qs(query).items()}
+                status, content_type, body = routes[path](params)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.end_headers()
+                for chunk in body:
+                    self.wfile.write(chunk)
+                return
+            if path != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
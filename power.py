@@ -0,0 +1,191 @@
+"""
+Monte Carlo power for the within-subject war/neutral design.
+
+    python power.py --participants 20 40 80 120 --per-category 2 4 6 --effect 0.3
+    python power.py --design random --studies 5000 --subject-slope-sd 0.5
+
+Each simulated study takes its participants' abstracts from the real
+assignment code: the first n sequences of a fresh AssignmentScheduler
+(--design scheduler, what the app does), or n draws from a pool of
+generate_experiment_sequence outputs (--design random). Every participant
+rates each of their abstracts in both conditions on a latent scale
+
+    rating = mean + subject + item + (war ? +1/2 : -1/2) * (effect + subject slope + item slope) + noise
+
+rounded and clipped to the 1-7 slider. Studies are then analysed like
+analysis.py (mean within-session war - neutral difference, one-sample t
+across sessions) and power is the share with p < alpha. Draws are NumPy
+arrays over (studies x participants x abstracts), and batches of studies
+run across a process pool.
+"""
+import argparse
+import os
+import random
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from analysis import summarize
+from content_store import ContentStore
+from scheduler import AssignmentScheduler
+from sequence import generate_experiment_sequence
+
+DEFAULTS = {
+    "effect": 0.3,            # war - neutral shift, in slider points
+    "mean": 4.0,
+    "subject_sd": 1.0,
+    "subject_slope_sd": 0.3,
+    "item_sd": 0.5,
+    "item_slope_sd": 0.2,
+    "residual_sd": 1.0,
+}
+
+
+def t_critical(df, alpha=0.05):
+    """
+    Two-sided critical t for `df` degrees of freedom, from the normal
+    quantile by the Cornish-Fisher expansion (Abramowitz & Stegun 26.7.5;
+    within 0.01 of exact for df >= 3).
+    """
+    z = statistics.NormalDist().inv_cdf(1 - alpha / 2)
+    g1 = (z ** 3 + z) / 4
+    g2 = (5 * z ** 5 + 16 * z ** 3 + 3 * z) / 96
+    g3 = (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / 384
+    g4 = (79 * z ** 9 + 776 * z ** 7 + 1482 * z ** 5 - 1920 * z ** 3 - 945 * z) / 92160
+    return z + g1 / df + g2 / df ** 2 + g3 / df ** 3 + g4 / df ** 4
+
+
+def design_items(sequences):
+    """
+    (participants x abstracts) array of the abstract indexes in each
+    encoded sequence, in order of first appearance.
+    """
+    rows = []
+    for codes in sequences:
+        items = np.frombuffer(codes, dtype=np.uint32) >> 1
+        _, first = np.unique(items, return_index=True)
+        rows.append(items[np.sort(first)])
+    return np.array(rows, dtype=np.int32)
+
+
+def _simulate(task):
+    # Runs in a worker process: `studies` simulated studies of n participants
+    key, design, n, sampled, n_items, p, studies, alpha, seed = task
+    rng = np.random.default_rng(seed)
+    k = design.shape[1]
+    crit = t_critical(n - 1, alpha)
+    significant = 0
+    estimates, dzs = [], []
+    # Keep each (studies x participants x abstracts) block around 2M cells
+    chunk = max(1, 2_000_000 // (n * k))
+    for start in range(0, studies, chunk):
+        s = min(chunk, studies - start)
+        if sampled:
+            items = design[rng.integers(0, len(design), size=(s, n))]
+        else:
+            items = np.broadcast_to(design[:n], (s, n, k))
+        rows = np.arange(s)[:, None, None]
+        item = rng.normal(0, p["item_sd"], (s, n_items)).astype(np.float32)[rows, items]
+        item_slope = rng.normal(0, p["item_slope_sd"], (s, n_items)).astype(np.float32)[rows, items]
+        subject = rng.normal(0, p["subject_sd"], (s, n, 1)).astype(np.float32)
+        subject_slope = rng.normal(0, p["subject_slope_sd"], (s, n, 1)).astype(np.float32)
+
+        base = p["mean"] + subject + item
+        half = (p["effect"] + subject_slope + item_slope) / 2
+        war = base + half + p["residual_sd"] * rng.standard_normal((s, n, k), dtype=np.float32)
+        neutral = base - half + p["residual_sd"] * rng.standard_normal((s, n, k), dtype=np.float32)
+        diff = np.clip(np.rint(war), 1, 7) - np.clip(np.rint(neutral), 1, 7)
+
+        # Sessions x studies, so summarize runs every study's t-test at once
+        mean, sd, _, dz, t = summarize(diff.mean(axis=2, dtype=np.float64).T)
+        significant += int(np.count_nonzero(np.abs(np.nan_to_num(t)) > crit))
+        estimates.append(mean)
+        dzs.append(dz)
+    return key, significant, float(np.concatenate(estimates).mean()), float(np.nanmean(np.concatenate(dzs)))
+
+
+def power_curve(content, participants, per_category=(4,), design="scheduler", studies=1000,
+                alpha=0.05, workers=None, seed=0, **params):
+    """
+    Returns one row per (per_category, participants) with the simulated
+    power, its Monte Carlo standard error, and the mean estimated
+    difference and dz. `params` override DEFAULTS.
+    """
+    p = dict(DEFAULTS, **params)
+    tasks = []
+    for pc in per_category:
+        rng = random.Random(seed + pc)
+        if design == "scheduler":
+            scheduler = AssignmentScheduler(content, per_category=pc, rng=rng)
+            items = design_items(scheduler.assign() for _ in range(max(participants)))
+            sampled = False
+        else:
+            pool = max(2000, 4 * max(participants))
+            items = design_items(generate_experiment_sequence(content, pc, rng) for _ in range(pool))
+            sampled = True
+        for n in participants:
+            # Batches of studies, so the pool has work to spread
+            per_task = max(50, -(-studies // 8))
+            for start in range(0, studies, per_task):
+                count = min(per_task, studies - start)
+                tasks.append(((pc, n), items, n, sampled, len(content), p, count, alpha, seed + len(tasks)))
+
+    if workers != 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_simulate, tasks))
+    else:
+        results = list(map(_simulate, tasks))
+
+    totals = {}
+    for (key, significant, estimate, dz), task in zip(results, tasks):
+        t = totals.setdefault(key, [0, 0, 0.0, 0.0])
+        count = task[6]
+        t[0] += significant
+        t[1] += count
+        t[2] += estimate * count
+        t[3] += dz * count
+    records = []
+    for (pc, n), (significant, count, estimate, dz) in sorted(totals.items()):
+        power = significant / count
+        records.append({
+            "per_category": pc, "participants": n, "power": power,
+            "se": (power * (1 - power) / count) ** 0.5,
+            "mean_diff": estimate / count, "dz": dz / count,
+        })
+    return pd.DataFrame.from_records(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, nargs="+", default=[20, 40, 60, 80, 100])
+    parser.add_argument("--per-category", type=int, nargs="+", default=[4])
+    parser.add_argument("--design", choices=["scheduler", "random"], default="scheduler")
+    parser.add_argument("--studies", type=int, default=1000)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--content", default=os.environ.get("SURVEY_CONTENT_PATH"),
+                        help="JSONL or CSV stimulus file (default: content.py)")
+    for name, value in DEFAULTS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=float, default=value)
+    args = parser.parse_args()
+
+    if args.content:
+        content = ContentStore.open(args.content)
+    else:
+        from content import ABSTRACTS
+        content = ContentStore.from_records(ABSTRACTS)
+    params = {name: getattr(args, name) for name in DEFAULTS}
+    curve = power_curve(content, args.participants, args.per_category, args.design, args.studies,
+                        args.alpha, args.workers, args.seed, **params)
+    print(", ".join(f"{k}={v:g}" for k, v in params.items()))
+    print(f"{args.studies} studies per cell, alpha={args.alpha}, design={args.design}\n")
+    table = curve.pivot(index="participants", columns="per_category", values="power")
+    table.columns = [f"{pc}/category" for pc in table.columns]
+    print(table.round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
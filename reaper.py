@@ -0,0 +1,121 @@
+import atexit
+import contextlib
+import threading
+import time
+
+from coordination import LockTimeout
+from metrics import REGISTRY
+from sessions import status_row
+
+
+class SessionReaper:
+    """
+    Background sweep for sessions a participant walked away from.
+
+    Every `interval` seconds:
+      1. Active sessions in the session log with no update for
+         `idle_timeout` seconds are flushed: their logged trials go to
+         `put` (the write-behind queue) with an 'abandoned' status record,
+         and the session is marked abandoned. A session left on the
+         debrief page finished the study but its commit failed, so it is
+         committed instead: a 'complete' status record, marked complete.
+         This reads the shared log, so sessions left behind by a replica
+         that has since gone are flushed too.
+      2. Sessions this process hasn't seen for `idle_timeout` seconds have
+         `release_keys` dropped from their in-memory state (see
+         SessionActivity.release) and are forgotten; state held for
+         sessions that have closed meanwhile is let go. A released session
+         restores itself from the session log on its next rerun.
+
+    Flushing takes the same "commit:<session id>" coordinator lock as the
+    debrief commit, so the two never interleave. A participant who comes
+    back carries on from the session log; their next trial makes the
+    session active again, and the already-flushed trials are not written
+    twice because the writer drops trials it has spooled before. The
+    session's 'complete' status record is stored after its 'abandoned' one
+    and supersedes it.
+    """
+
+    def __init__(self, log, put, activity=None, idle_timeout=1800.0, interval=60.0,
+                 coordinator=None, release_keys=()):
+        self.log = log
+        self.put = put
+        self.activity = activity
+        self.idle_timeout = idle_timeout
+        self.interval = interval
+        self.coordinator = coordinator
+        self.release_keys = tuple(release_keys)
+        self.last_error = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="session-reaper", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def stop(self, timeout=10.0):
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                self.last_error = repr(e)
+
+    def sweep(self):
+        """
+        Runs one pass. Returns (sessions flushed, sessions released).
+        """
+        flushed = {"abandoned": 0, "complete": 0}
+        for session_id in self.log.idle_sessions(time.time() - self.idle_timeout):
+            try:
+                status = self.flush(session_id)
+            except LockTimeout:
+                # Being committed or flushed elsewhere; look again next pass
+                continue
+            if status is not None:
+                flushed[status] += 1
+        released = 0
+        if self.activity is not None:
+            self.activity.prune()
+            for session_id in self.activity.idle(self.idle_timeout):
+                if self.activity.release(session_id, self.release_keys, self.idle_timeout):
+                    released += 1
+        if flushed["abandoned"]:
+            REGISTRY.inc("survey_sessions_abandoned_total", flushed["abandoned"])
+        if flushed["complete"]:
+            REGISTRY.inc("survey_sessions_recovered_total", flushed["complete"])
+        if released:
+            REGISTRY.inc("survey_sessions_released_total", released)
+        return sum(flushed.values()), released
+
+    def flush(self, session_id):
+        """
+        Flushes an idle session's logged trials: as complete if it is on
+        the debrief page (what the debrief commit would have done), else
+        as abandoned. Returns the status written, or None if the session
+        was no longer active.
+        """
+        lock = (self.coordinator.lock(f"commit:{session_id}") if self.coordinator is not None
+                else contextlib.nullcontext())
+        with lock:
+            saved = self.log.load(session_id)
+            if saved is None or saved["status"] != "active":
+                return None
+            rows = saved["responses"]
+            if saved["page"] == "debrief":
+                self.put(rows + [status_row(session_id, "complete")])
+                self.log.mark_complete(session_id)
+                return "complete"
+            if rows:
+                self.put(rows + [status_row(session_id, "abandoned")])
+            self.log.mark_abandoned(session_id)
+        return "abandoned"
@@ -0,0 +1,195 @@
+import html
+import threading
+from collections import OrderedDict
+
+from sequence import CONDITIONS
+
+# --- Static page chrome ---
+# Everything here is formatted once at import time; reruns only look it up.
+
+
+def _compact(fragment):
+    """
+    Strips indentation and blank lines so Markdown never treats a line as
+    a code block or ends the HTML block early.
+    """
+    return "\n".join(line.strip() for line in fragment.splitlines() if line.strip())
+
+
+CUSTOM_CSS = _compact("""
+<style>
+/* General app styling */
+.stApp {
+    background-color: #f8f9fa;
+}
+
+/* Abstract Card Styling */
+.abstract-card {
+    background-color: #ffffff;
+    padding: 2.5rem;
+    border-radius: 12px;
+    box-shadow: 0 4px 12px rgba(0,0,0,0.05);
+    margin-bottom: 2rem;
+    border-left: 5px solid #4a90e2;
+}
+
+.abstract-text {
+    font-family: 'Georgia', serif;
+    font-size: 1.0rem;
+    line-height: 1.6;
+    color: #2c3e50;
+}
+
+.question-header {
+    color: #7f8c8d;
+    font-size: 1.2rem;
+    text-transform: uppercase;
+    letter-spacing: 1px;
+    margin-bottom: 1rem;
+    font-weight: 600;
+}
+
+/* Slider Styling Tweaks */
+.stSlider label p {
+    font-weight: 400 !important;
+    color: #34495e !important;
+    font-size: 1.1rem !important;
+}
+
+/* Progress Bar */
+.progress-text {
+    text-align: center;
+    color: #7f8c8d;
+    font-size: 0.9rem;
+    margin-bottom: 0.5rem;
+}
+
+/* Buttons */
+.stButton button {
+    width: 100%;
+    background-color: #4a90e2;
+    color: white;
+    font-weight: 600;
+    border-radius: 8px;
+    padding: 0.5rem 1rem;
+    border: none;
+}
+.stButton button:hover {
+    background-color: #357abd;
+    color: white;
+}
+
+/* Hide Streamlit Form Border */
+[data-testid="stForm"] {
+    border: none;
+    padding: 0;
+}
+</style>
+""")
+
+CONSENT_TITLE = "<h1 style='text-align: center; color: #2c3e50;'>Research Study Participation</h1>"
+
+CONSENT_HTML = _compact("""
+<div style='background-color: white; padding: 2rem; border-radius: 12px; box-shadow: 0 2px 8px rgba(0,0,0,0.05);'>
+    <h3 style='color: #2c3e50; margin-top: 0;'>Welcome</h3>
+    <p style='font-size: 1.1rem; line-height: 1.6;'>
+        We are conducting a scientific study on how people interpret and respond to scientific texts. 
+        Your contribution is valuable to helping us understand communication dynamics in science.
+    </p>
+    <hr style='border: 0; border-top: 1px solid #eee; margin: 1.5rem 0;'>
+    <p><strong>What to expect:</strong></p>
+    <ul style='line-height: 1.6;'>
+        <li>You will read a series of <strong>40 short abstracts</strong>.</li>
+        <li>For each, you will answer 4 brief questions ensuring your impressions.</li>
+        <li>The total time required is approximately <strong>20-30 minutes</strong>.</li>
+    </ul>
+    <p style='font-size: 0.9rem; color: #666; margin-top: 1.5rem;'>
+        <em>Your participation is entirely voluntary, and all responses will remain anonymous.</em>
+    </p>
+</div>
+""")
+
+INSTRUCTIONS_TITLE = "<h1 style='text-align: center; color: #2c3e50;'>Instructions</h1>"
+
+INSTRUCTIONS_HTML = _compact("""
+<div style='background-color: white; padding: 2rem; border-radius: 12px; box-shadow: 0 2px 8px rgba(0,0,0,0.05);'>
+    <p style='font-size: 1.2rem; line-height: 1.6; text-align: center;'>
+        In this task, you will be presented with scientific abstracts, one at a time.
+    </p>
+    <br>
+    <div style='display: flex; justify-content: center;'>
+        <div style='text-align: left; max-width: 600px;'>
+            <p><strong>1. Read Carefully:</strong> Please read each abstract thoroughly.</p>
+            <p><strong>2. Rate Honestly:</strong> There are no right or wrong answers. We are interested in your immediate, honest impressions.</p>
+            <p><strong>3. Stay Focused:</strong> Please try to complete the session in one sitting.</p>
+        </div>
+    </div>
+</div>
+""")
+
+QUESTION_HEADER_1 = "<div class='question-header'>Part 1: Assessment</div>"
+QUESTION_HEADER_2 = "<div class='question-header'>Part 2: Action</div>"
+QUESTION_DIVIDER = "<hr style='margin: 2rem 0; border-top: 1px solid #eee;'>"
+
+
+# --- Per-trial fragments ---
+
+def render_card(text):
+    return (
+        "<div class='abstract-card'><div class='abstract-text'>"
+        f"{html.escape(text, quote=False)}"
+        "</div></div>"
+    )
+
+
+def render_progress(index, total):
+    return f"<p class='progress-text'>Abstract {index + 1} of {total}</p>"
+
+
+class RenderCache:
+    """
+    Pre-rendered HTML keyed by (abstract index, condition), plus every
+    progress label, shared by all sessions in the process. Cards are
+    rendered the first time any session needs them and kept in an LRU of
+    at most `max_cards`, so memory stays bounded whatever the corpus size
+    and large corpora don't have to be read at startup. `warm()` renders
+    cards up front, up to that same bound.
+    """
+
+    def __init__(self, content, total=40, max_cards=2048):
+        self.content = content
+        self.cards = OrderedDict()
+        self.max_cards = max_cards
+        self.total = total
+        self.progress = [render_progress(i, total) for i in range(total)]
+        self._lock = threading.Lock()
+
+    def warm(self):
+        for i in range(min(len(self.content), self.max_cards // len(CONDITIONS))):
+            for condition in CONDITIONS:
+                self.card(i, condition)
+        return self
+
+    def card(self, abstract_index, condition):
+        key = (abstract_index, condition)
+        # Hits take no lock: OrderedDict's C methods are atomic, and a card
+        # evicted between the two calls is simply no longer recent
+        html_fragment = self.cards.get(key)
+        if html_fragment is not None:
+            try:
+                self.cards.move_to_end(key)
+            except KeyError:
+                pass
+            return html_fragment
+        # Two sessions may both render a missing card; either copy will do
+        html_fragment = render_card(self.content.text(abstract_index, condition))
+        with self._lock:
+            self.cards[key] = html_fragment
+            if len(self.cards) > self.max_cards:
+                self.cards.popitem(last=False)
+        return html_fragment
+
+    def progress_text(self, index, total):
+        if total == self.total:
+            return self.progress[index]
+        return render_progress(index, total)
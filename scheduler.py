@@ -0,0 +1,190 @@
+import heapq
+import random
+import threading
+from array import array
+
+from sequence import CONDITIONS, encode
+
+
+def williams_row(n, r):
+    """
+    Row `r` of a balanced Latin square (Williams design) of order `n`.
+    Across n consecutive rows every slot takes every position once and,
+    for even n, directly precedes every other slot once. For odd n the
+    rows have to be paired with their mirror images for that (see
+    AssignmentScheduler._assign).
+    """
+    first = [0]
+    lo, hi = 1, n - 1
+    while len(first) < n:
+        first.append(lo)
+        lo += 1
+        if len(first) < n:
+            first.append(hi)
+            hi -= 1
+    return [(x + r) % n for x in first]
+
+
+class AssignmentScheduler:
+    """
+    Counterbalanced replacement for per-session random.sample.
+
+    Keeps global exposure counts per (abstract, condition) and a min-heap
+    per category, so each new session gets the least-exposed items of every
+    category in O(k log n). Which condition an abstract is shown in first
+    is balanced per abstract. Trial order follows successive rows of a
+    balanced Latin square over stable slots (category, then exposure rank
+    within the category), so across sessions each slot is shown at every
+    position equally often and after every other slot equally often. The
+    order is shown twice, once per condition, so the two versions of an
+    abstract are always len(chosen) trials apart. All state is guarded by
+    one lock, so concurrent sessions never receive a design built from
+    stale counts.
+
+    With a `coordinator` the counts are shared by every replica: each
+    assignment runs under the coordinator's "scheduler" lock, first
+    catching up with sessions other replicas assigned, then adding its own.
+    """
+
+    def __init__(self, content, per_category=4, ordering="latin", rng=None, coordinator=None):
+        self.content = content
+        self.per_category = per_category
+        self.ordering = ordering
+        self.rng = rng or random.Random()
+        self.coordinator = coordinator
+        self.exposures = {}     # (abstract index, condition) -> sessions
+        self.shown_first = {}   # (abstract index, condition) -> times shown first
+        self.sessions = 0
+        self._lock = threading.Lock()
+        self._build_heaps()
+
+    def _build_heaps(self):
+        self._heaps = {}
+        for cat, items in self.content.by_category.items():
+            heap = [(self._exposure(i), self.rng.random(), i) for i in items]
+            heapq.heapify(heap)
+            self._heaps[cat] = heap
+
+    def _exposure(self, i):
+        return min(self.exposures.get((i, c), 0) for c in CONDITIONS)
+
+    def record(self, sequences):
+        """
+        Counts existing sequences of (abstract index, condition) pairs,
+        e.g. the sessions in the session log after a restart.
+        """
+        if self.coordinator is not None:
+            # Shared counts are seeded once, by whichever replica starts first
+            with self._lock, self.coordinator.lock("scheduler"):
+                if not self.coordinator.counters("scheduler").get("seeded"):
+                    deltas = {"seeded": 1}
+                    for sequence in sequences:
+                        self._count(sequence, deltas)
+                    self.coordinator.incr("scheduler", deltas)
+                    self._build_heaps()
+                self._sync()
+            return
+        with self._lock:
+            for sequence in sequences:
+                self._count(sequence)
+            self._build_heaps()
+
+    def _count(self, sequence, deltas=None):
+        seen = set()
+        for i, condition in sequence:
+            key = (i, condition)
+            self.exposures[key] = self.exposures.get(key, 0) + 1
+            first = i not in seen
+            if first:
+                seen.add(i)
+                self.shown_first[key] = self.shown_first.get(key, 0) + 1
+            if deltas is not None:
+                # Shared counts are keyed by abstract id, which every replica agrees on
+                field = f"{self.content.ids[i]}|{condition}"
+                deltas["exposures|" + field] = deltas.get("exposures|" + field, 0) + 1
+                if first:
+                    deltas["first|" + field] = deltas.get("first|" + field, 0) + 1
+        self.sessions += 1
+        if deltas is not None:
+            deltas["sessions"] = deltas.get("sessions", 0) + 1
+
+    def _sync(self):
+        # Reload shared counts if another replica has assigned since we last looked
+        shared = self.coordinator.counters("scheduler")
+        if shared.get("sessions", 0) == self.sessions:
+            return
+        self.exposures, self.shown_first = {}, {}
+        for field, value in shared.items():
+            kind, _, rest = field.partition("|")
+            if kind not in ("exposures", "first"):
+                continue
+            abstract_id, condition = rest.rsplit("|", 1)
+            if abstract_id in self.content.index:
+                target = self.exposures if kind == "exposures" else self.shown_first
+                target[(self.content.index[abstract_id], condition)] = value
+        self.sessions = shared.get("sessions", 0)
+        self._build_heaps()
+
+    def assign(self):
+        """
+        Returns the next session's sequence as an array of encoded trials.
+        """
+        if self.coordinator is None:
+            with self._lock:
+                return self._assign()
+        with self._lock, self.coordinator.lock("scheduler"):
+            self._sync()
+            return self._assign()
+
+    def _assign(self):
+        # 1. Least-exposed items per category
+        chosen = []
+        for heap in self._heaps.values():
+            picked = [heapq.heappop(heap) for _ in range(min(self.per_category, len(heap)))]
+            for count, _, i in picked:
+                heapq.heappush(heap, (count + 1, self.rng.random(), i))
+            chosen.extend(i for _, _, i in picked)
+
+        # 2. Order the trials. "latin": `chosen` is in slot order (category,
+        #    then exposure rank), and the slots follow successive rows of a
+        #    balanced Latin square; odd orders alternate each row with its
+        #    mirror image, which restores the carryover balance. Every item
+        #    is shown once in each half in that same order, so its two
+        #    versions are len(chosen) trials apart. Otherwise a plain
+        #    shuffle of all 2 x len(chosen) trials.
+        n = len(chosen)
+        if self.ordering == "latin":
+            if n % 2 == 0:
+                row = williams_row(n, self.sessions % n)
+            else:
+                row = williams_row(n, (self.sessions // 2) % n)
+                if self.sessions % 2:
+                    row.reverse()
+            order = row + row
+        else:
+            order = [k for k in range(n) for _ in CONDITIONS]
+            self.rng.shuffle(order)
+
+        # 3. The first showing of each item gets the condition that has
+        #    been shown first least often for that abstract
+        first_condition = {}
+        for k, i in enumerate(chosen):
+            first_condition[k] = min(
+                CONDITIONS, key=lambda c: (self.shown_first.get((i, c), 0), self.rng.random())
+            )
+        sequence = []
+        started = set()
+        for k in order:
+            i = chosen[k]
+            if k not in started:
+                started.add(k)
+                condition = first_condition[k]
+            else:
+                condition = CONDITIONS[1 - CONDITIONS.index(first_condition[k])]
+            sequence.append((i, condition))
+
+        deltas = {} if self.coordinator is not None else None
+        self._count(sequence, deltas)
+        if deltas:
+            self.coordinator.incr("scheduler", deltas)
+        return array('I', [encode(i, condition) for i, condition in sequence])
@@ -0,0 +1,250 @@
+"""
+Data-quality screening of sessions in the response store.
+
+    python screening.py responses.db            # update the cache, list flagged sessions
+    python screening.py responses.db --rebuild  # rescreen every session
+    python screening.py export/                 # a Parquet export (export.py), e.g. of a sheet
+
+Flags per session, all computed column-wise over the whole batch:
+  straight_lining  share of trials with all four sliders at the default
+                   (4) is at least --straight-share
+  too_fast         median reading-plus-rating time below --min-median-ms,
+                   or (when no latencies were recorded) the whole session
+                   took less than --min-duration seconds
+  partial          fewer distinct trials than --trials
+  duplicate        some trial_index stored more than once
+  out_of_order     trial_index does not increase with submit time
+"""
+import argparse
+import glob
+import json
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+from export import STATE_FILE
+from sessions import MEASURES
+
+DEFAULTS = {
+    "trials": 40,
+    "default_rating": 4,
+    "straight_share": 0.9,
+    "min_median_ms": 3000.0,
+    "min_duration": 240.0,
+}
+
+FLAGS = ["straight_lining", "too_fast", "partial", "duplicate", "out_of_order"]
+
+SCREENING_FILE = "_screening.db"
+
+
+def screen_sessions(df, **options):
+    """
+    Returns one row per session_id with the screening metrics, one boolean
+    column per flag and `excluded` (any flag set).
+    """
+    opts = dict(DEFAULTS, **options)
+    # Session status records aren't trials
+    df = df[df["trial_index"].notna()]
+    df = df.sort_values(["session_id", "timestamp"], kind="stable")
+    sid = df["session_id"].to_numpy()
+    by_session = df.groupby("session_id", sort=True)
+
+    ratings = df[list(MEASURES)].to_numpy(dtype=float)
+    default_trial = (ratings == opts["default_rating"]).all(axis=1)
+
+    # trial_index must strictly increase with submit time within a session;
+    # repeated copies of a trial are the duplicate flag's business, not this one
+    first = ~df.duplicated(["session_id", "trial_index"]).to_numpy()
+    trial = df["trial_index"].to_numpy(dtype=float)[first]
+    kept = sid[first]
+    same_session = np.concatenate([[False], kept[1:] == kept[:-1]])
+    backwards = same_session & (np.diff(trial, prepend=np.nan) <= 0)
+
+    rt = df["response_ms"] if "response_ms" in df else pd.Series(np.nan, index=df.index)
+
+    out = pd.DataFrame({
+        "rows": by_session.size(),
+        "trials": by_session["trial_index"].nunique(),
+        "default_share": pd.Series(default_trial, index=df.index).groupby(sid).mean(),
+        "median_rt_ms": pd.to_numeric(rt, errors="coerce").groupby(sid).median(),
+        "duration_s": by_session["timestamp"].max() - by_session["timestamp"].min(),
+        "backwards_steps": pd.Series(backwards).groupby(kept).sum(),
+    })
+    out.index.name = "session_id"
+
+    out["straight_lining"] = out["default_share"] >= opts["straight_share"]
+    out["too_fast"] = np.where(
+        out["median_rt_ms"].notna(),
+        out["median_rt_ms"] < opts["min_median_ms"],
+        out["duration_s"] < opts["min_duration"],
+    )
+    out["partial"] = out["trials"] < opts["trials"]
+    out["duplicate"] = out["rows"] > out["trials"]
+    out["out_of_order"] = out["backwards_steps"] > 0
+    out["excluded"] = out[FLAGS].any(axis=1)
+    return out
+
+
+class Screener:
+    """
+    Cached, incremental screening over a SQLiteStore database.
+
+    Results live in a `session_flags` table next to the responses, with a
+    rowid watermark. `update` reads only rows appended since the last run,
+    rescreens just the sessions they belong to (an indexed lookup per
+    session) and upserts their flags.
+    """
+
+    WATERMARK = "last_rowid"
+
+    def __init__(self, path, table="responses", **options):
+        self.path = path
+        self.table = table
+        self.options = options
+        self._conn = sqlite3.connect(path, timeout=30)
+        with self._conn:
+            self._conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "{table}_session_idx" ON "{table}" (session_id)'
+            )
+            self._conn.execute("CREATE TABLE IF NOT EXISTS screening_meta (key TEXT PRIMARY KEY, value)")
+
+    def _watermark(self):
+        r = self._conn.execute("SELECT value FROM screening_meta WHERE key = ?", (self.WATERMARK,)).fetchone()
+        return r[0] if r else 0
+
+    def _top(self):
+        return self._conn.execute(f'SELECT MAX(rowid) FROM "{self.table}"').fetchone()[0] or 0
+
+    def _session_rows(self, last, top):
+        """
+        Returns every row up to `top` of the sessions with rows after `last`.
+        """
+        sessions = [r[0] for r in self._conn.execute(
+            f'SELECT DISTINCT session_id FROM "{self.table}" WHERE rowid > ? AND rowid <= ?', (last, top)
+        )]
+        frames = []
+        # Chunk the IN list to stay under SQLite's parameter limit
+        for start in range(0, len(sessions), 500):
+            chunk = sessions[start:start + 500]
+            marks = ", ".join("?" for _ in chunk)
+            frames.append(pd.read_sql_query(
+                f'SELECT * FROM "{self.table}" WHERE session_id IN ({marks}) AND rowid <= ?',
+                self._conn, params=chunk + [top],
+            ))
+        return pd.concat(frames, ignore_index=True)
+
+    def update(self, rebuild=False):
+        """
+        Screens sessions with new rows. Returns the number rescreened.
+        """
+        last = 0 if rebuild else self._watermark()
+        top = self._top()
+        if top <= last:
+            return 0
+        flags = screen_sessions(self._session_rows(last, top), **self.options)
+        flags = flags.reset_index()
+        flags[FLAGS + ["excluded"]] = flags[FLAGS + ["excluded"]].astype(int)
+        with self._conn:
+            if rebuild:
+                self._conn.execute("DROP TABLE IF EXISTS session_flags")
+            columns = list(flags.columns)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_flags (session_id TEXT PRIMARY KEY, "
+                + ", ".join(f'"{c}"' for c in columns[1:]) + ")"
+            )
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO session_flags ({', '.join(columns)}) "
+                f"VALUES ({', '.join('?' for _ in columns)})",
+                flags.astype(object).where(flags.notna(), None).itertuples(index=False, name=None),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO screening_meta (key, value) VALUES (?, ?)", (self.WATERMARK, top)
+            )
+        return len(flags)
+
+    def flags(self):
+        return pd.read_sql_query("SELECT * FROM session_flags", self._conn, index_col="session_id")
+
+    def excluded_sessions(self):
+        return {r[0] for r in self._conn.execute("SELECT session_id FROM session_flags WHERE excluded = 1")}
+
+    def close(self):
+        self._conn.close()
+
+
+class ExportScreener(Screener):
+    """
+    The same cache over a Parquet export directory (export.py), for stores
+    that are only readable through an export, such as a downloaded sheet.
+
+    Flags live in `_screening.db` inside the export, and the watermark is
+    the export's last source position. Every export file is named after
+    the first position it holds (a compacted one, also after the first
+    position of the last file merged into it), so files named past the
+    watermark hold the new rows; their sessions are rescreened. A merge
+    that takes in new files rescreens the sessions of the older ones too.
+    """
+
+    WATERMARK = "last_position"
+
+    def __init__(self, root, **options):
+        self.root = root
+        self.options = options
+        self._conn = sqlite3.connect(os.path.join(root, SCREENING_FILE), timeout=30)
+        with self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS screening_meta (key TEXT PRIMARY KEY, value)")
+
+    def _top(self):
+        path = os.path.join(self.root, STATE_FILE)
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            return json.load(f)["last"]
+
+    def _session_rows(self, last, top):
+        sessions = set()
+        for path in glob.glob(os.path.join(self.root, "study_date=*", "category=*", "part-*.parquet")):
+            # part-<first>.parquet or part-<first>-<first of last merged>.parquet
+            if last < int(os.path.basename(path)[:-len(".parquet")].split("-")[-1]) <= top:
+                sessions.update(pq.read_table(path, columns=["session_id"]).column(0).to_pylist())
+        df = pd.read_parquet(
+            self.root, columns=["session_id", "trial_index", "timestamp", "response_ms"] + list(MEASURES),
+            filters=[("session_id", "in", sorted(sessions))],
+        )
+        # Back to the stores' float epoch seconds, so duration_s is seconds
+        df["timestamp"] = (df["timestamp"] - pd.Timestamp(0, tz="UTC")).dt.total_seconds()
+        return df.astype({c: float for c in ["trial_index", "response_ms"] + list(MEASURES)})
+
+
+def open_screener(path, **options):
+    """
+    Screener for a SQLiteStore database, or ExportScreener for a Parquet
+    export directory.
+    """
+    return ExportScreener(path, **options) if os.path.isdir(path) else Screener(path, **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", nargs="?", default=os.environ.get("SURVEY_DB_PATH", "responses.db"))
+    parser.add_argument("--rebuild", action="store_true")
+    for name, value in DEFAULTS.items():
+        parser.add_argument("--" + name.replace("_", "-"), type=type(value), default=value)
+    args = parser.parse_args()
+
+    options = {name: getattr(args, name) for name in DEFAULTS}
+    screener = open_screener(args.db, **options)
+    print(f"rescreened {screener.update(rebuild=args.rebuild)} session(s)")
+    flags = screener.flags()
+    flagged = flags[flags["excluded"] == 1]
+    print(f"{len(flagged)} of {len(flags)} session(s) flagged")
+    if len(flagged):
+        print(flagged[FLAGS].to_string())
+
+
+if __name__ == "__main__":
+    main()
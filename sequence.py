@@ -0,0 +1,46 @@
+import random
+from array import array
+
+# Condition bit stored in the low bit of each sequence entry
+CONDITIONS = ("war", "neutral")
+CONDITION_BITS = {name: bit for bit, name in enumerate(CONDITIONS)}
+
+
+def encode(abstract_index, condition):
+    return (abstract_index << 1) | CONDITION_BITS[condition]
+
+
+def decode(code):
+    """
+    Returns (abstract_index, condition) for one sequence entry.
+    """
+    return code >> 1, CONDITIONS[code & 1]
+
+
+def generate_experiment_sequence(content, per_category=4, rng=None):
+    """
+    Generates a sequence of 40 abstracts (20 unique IDs x 2 conditions).
+    Balanced across 5 categories: 4 unique IDs per category.
+    `content` is a ContentStore; each entry is an index into it with the
+    condition in the low bit (see encode/decode), packed into a 32-bit array.
+    `per_category` and a seeded `rng` (random.Random) are for simulations.
+    """
+    rng = rng or random
+    selected_items = []
+
+    # 1. For each category (indexed once by the content store), select per_category unique IDs
+    for cat, items in content.by_category.items():
+        # We need at least per_category items per category.
+        if len(items) < per_category:
+            chosen = items
+        else:
+            chosen = rng.sample(items, per_category)
+
+        # For each chosen ID, add BOTH War and Neutral conditions
+        for i in chosen:
+            selected_items.append(encode(i, "war"))
+            selected_items.append(encode(i, "neutral"))
+
+    # 2. Shuffle the final sequence completely
+    rng.shuffle(selected_items)
+    return array('I', selected_items)
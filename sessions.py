@@ -0,0 +1,397 @@
+import json
+from array import array
+import sqlite3
+import threading
+import time
+import uuid
+
+
+SESSION_COLUMNS = {
+    "status": "TEXT NOT NULL DEFAULT 'active'",
+    "page": "TEXT NOT NULL DEFAULT 'consent'",
+    "sequence": "TEXT",
+    "current_index": "INTEGER NOT NULL DEFAULT 0",
+    "created_at": "REAL",
+    "updated_at": "REAL NOT NULL DEFAULT 0",
+}
+
+
+MEASURES = ("credibility", "urgency", "policy_support", "gov_funding")
+
+
+class ResponseBuffer:
+    """
+    Fixed-size, array-backed record of a session's ratings. Trial i's four
+    slider values live at ratings[4*i:4*i+4]; abstract and condition are not
+    stored because they follow from the session's sequence.
+    """
+    __slots__ = ("ratings", "timestamps", "response_ms", "count")
+
+    def __init__(self, capacity):
+        self.ratings = array('B', bytes(len(MEASURES) * capacity))
+        self.timestamps = array('d', bytes(8 * capacity))
+        self.response_ms = array('d', bytes(8 * capacity))
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, row):
+        i = row["trial_index"] - 1
+        base = i * len(MEASURES)
+        for j, measure in enumerate(MEASURES):
+            self.ratings[base + j] = row[measure]
+        self.timestamps[i] = row["timestamp"]
+        self.response_ms[i] = row.get("response_ms") or 0.0
+        self.count = max(self.count, i + 1)
+
+    @classmethod
+    def from_rows(cls, capacity, rows):
+        buf = cls(capacity)
+        for row in rows:
+            buf.append(row)
+        return buf
+
+
+class SessionActivity:
+    """
+    In-memory last-activity time per session (monotonic clock), and
+    optionally the session's state, so an idle session can be released
+    from another thread.
+    """
+
+    def __init__(self):
+        self.last_seen = {}
+        self.states = {}
+        self._lock = threading.Lock()
+
+    def touch(self, session_id, state=None, alive=None):
+        """
+        Records activity. `state` is the session's state mapping, for
+        `release` (for Streamlit, its SafeSessionState, so deletes from
+        the reaper's thread are locked against the script run); `alive`, if given, tells whether the session behind it
+        still exists (see `prune`).
+        """
+        with self._lock:
+            self.last_seen[session_id] = time.monotonic()
+            if state is not None:
+                self.states[session_id] = (state, alive)
+
+    def forget(self, session_id):
+        with self._lock:
+            self.last_seen.pop(session_id, None)
+            self.states.pop(session_id, None)
+
+    def active(self, window=900.0):
+        """
+        Number of sessions seen in the last `window` seconds.
+        """
+        cutoff = time.monotonic() - window
+        with self._lock:
+            return sum(1 for t in self.last_seen.values() if t >= cutoff)
+
+    def idle(self, timeout):
+        """
+        Sessions not seen for `timeout` seconds.
+        """
+        cutoff = time.monotonic() - timeout
+        with self._lock:
+            return [sid for sid, t in self.last_seen.items() if t < cutoff]
+
+    def prune(self):
+        """
+        Lets go of the state of sessions that no longer exist, so holding
+        it here doesn't keep it alive. Returns the number dropped.
+        """
+        with self._lock:
+            held = list(self.states.items())
+        gone = [sid for sid, (_, alive) in held if alive is not None and not alive()]
+        with self._lock:
+            for sid in gone:
+                self.states.pop(sid, None)
+        return len(gone)
+
+    def release(self, session_id, keys, timeout=None):
+        """
+        Drops `keys` from the session's state, if it is held, and forgets
+        the session. With a `timeout`, a session seen within it is left
+        alone (it came back after idle() listed it). Returns True if any
+        state was released.
+        """
+        with self._lock:
+            seen = self.last_seen.get(session_id)
+            if timeout is not None and seen is not None and seen >= time.monotonic() - timeout:
+                return False
+            self.last_seen.pop(session_id, None)
+            state, _ = self.states.pop(session_id, (None, None))
+        released = False
+        for key in keys if state is not None else ():
+            try:
+                del state[key]
+                released = True
+            except KeyError:
+                pass
+        return released
+
+
+def new_session_id():
+    """
+    Collision-free, URL-safe session token.
+    """
+    return uuid.uuid4().hex
+
+
+def status_row(session_id, status):
+    """
+    Response-store record of a session's status ('complete' or
+    'abandoned'). It has no trial_index, so it is stored beside the
+    session's trials rather than deduplicated against them; a session's
+    latest status record is its status.
+    """
+    return {"session_id": session_id, "session_status": status, "timestamp": time.time()}
+
+
+class SessionLog:
+    """
+    Local append log of submitted trials, written as each form is submitted,
+    plus a per-session progress record (page, sequence, current index).
+    Both tables are keyed by session_id, so resuming a session is a primary
+    key lookup and a range read of that session's trials only.
+    A session stays 'active' until the debrief page commits it ('complete')
+    or it sits idle long enough for the reaper to flush what it has
+    ('abandoned'); a trial submitted after that makes it active again.
+    """
+
+    def __init__(self, path="trials.db"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS trials (
+                    session_id TEXT NOT NULL,
+                    trial_index INTEGER NOT NULL,
+                    row TEXT NOT NULL,
+                    PRIMARY KEY (session_id, trial_index)
+                ) WITHOUT ROWID
+            """)
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY)")
+            existing = {r[1] for r in self._conn.execute("PRAGMA table_info(sessions)")}
+            for col, decl in SESSION_COLUMNS.items():
+                if col not in existing:
+                    self._conn.execute(f"ALTER TABLE sessions ADD COLUMN {col} {decl}")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_idle ON sessions (status, updated_at)")
+
+    def start(self, session_id, sequence):
+        """
+        Creates the progress record for a new session. `sequence` must be
+        JSON-serialisable.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, sequence, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?)",
+                (session_id, json.dumps(sequence), now, now),
+            )
+
+    def load(self, session_id):
+        """
+        Returns the saved progress of a session, or None if it is unknown.
+        """
+        with self._lock:
+            r = self._conn.execute(
+                "SELECT status, page, sequence, current_index FROM sessions WHERE session_id = ?",
+                (session_id,),
+            ).fetchone()
+        if r is None or r[2] is None:
+            return None
+        return {
+            "status": r[0],
+            "page": r[1],
+            "sequence": json.loads(r[2]),
+            "current_index": r[3],
+            "responses": self.session_rows(session_id),
+        }
+
+    def sequences(self):
+        """
+        Yields the [abstract_id, condition] sequence of every session.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT sequence FROM sessions WHERE sequence IS NOT NULL"
+            ).fetchall()
+        for (sequence,) in rows:
+            yield json.loads(sequence)
+
+    def set_page(self, session_id, page):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sessions SET page = ?, updated_at = ? WHERE session_id = ?",
+                (page, time.time(), session_id),
+            )
+
+    def record_trial(self, session_id, row):
+        """
+        Appends one response row. Re-submitting the same trial replaces it.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO trials (session_id, trial_index, row) VALUES (?, ?, ?)",
+                (session_id, row["trial_index"], json.dumps(row)),
+            )
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, current_index, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET "
+                "current_index = MAX(current_index, excluded.current_index), "
+                "status = CASE status WHEN 'abandoned' THEN 'active' ELSE status END, "
+                "updated_at = excluded.updated_at",
+                (session_id, row["trial_index"], now),
+            )
+
+    def session_rows(self, session_id):
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT row FROM trials WHERE session_id = ? ORDER BY trial_index", (session_id,)
+            )
+            return [json.loads(r[0]) for r in cur]
+
+    def status(self, session_id):
+        with self._lock:
+            r = self._conn.execute(
+                "SELECT status FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return r[0] if r else None
+
+    def mark_complete(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, status, updated_at) VALUES (?, 'complete', ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET status = 'complete', updated_at = excluded.updated_at",
+                (session_id, time.time()),
+            )
+
+    def mark_abandoned(self, session_id):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sessions SET status = 'abandoned', updated_at = ? "
+                "WHERE session_id = ? AND status = 'active'",
+                (time.time(), session_id),
+            )
+
+    def idle_sessions(self, before):
+        """
+        Ids of active sessions with a sequence and no update since `before`
+        (epoch seconds).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT session_id FROM sessions WHERE status = 'active' AND updated_at < ? "
+                "AND sequence IS NOT NULL",
+                (before,),
+            ).fetchall()
+        return [r[0] for r in rows]
+
+
+class RedisSessionLog:
+    """
+    SessionLog kept in Redis (or a LocalRedis), for replicas on several
+    hosts. Each session is a hash of its progress record plus a hash of
+    its trials keyed by trial_index; the set of all session ids stands in
+    for a table scan, and a second set holds the active ones.
+    """
+
+    def __init__(self, client, prefix="survey:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _session(self, session_id):
+        return f"{self.prefix}session:{session_id}"
+
+    def _trials(self, session_id):
+        return f"{self.prefix}trials:{session_id}"
+
+    @property
+    def _active(self):
+        return f"{self.prefix}active"
+
+    def start(self, session_id, sequence):
+        now = time.time()
+        if self.client.hsetnx(self._session(session_id), "sequence", json.dumps(sequence)):
+            self.client.hset(self._session(session_id), mapping={
+                "status": "active", "page": "consent", "current_index": 0,
+                "created_at": now, "updated_at": now,
+            })
+        self.client.sadd(f"{self.prefix}sessions", session_id)
+        self.client.sadd(self._active, session_id)
+
+    def load(self, session_id):
+        r = self.client.hgetall(self._session(session_id))
+        if not r.get("sequence"):
+            return None
+        return {
+            "status": r.get("status", "active"),
+            "page": r.get("page", "consent"),
+            "sequence": json.loads(r["sequence"]),
+            "current_index": int(r.get("current_index", 0)),
+            "responses": self.session_rows(session_id),
+        }
+
+    def sequences(self):
+        ids = self.client.smembers(f"{self.prefix}sessions")
+        pipe = self.client.pipeline()
+        for session_id in ids:
+            pipe.hget(self._session(session_id), "sequence")
+        for sequence in pipe.execute():
+            if sequence:
+                yield json.loads(sequence)
+
+    def set_page(self, session_id, page):
+        self.client.hset(self._session(session_id), mapping={"page": page, "updated_at": time.time()})
+
+    def record_trial(self, session_id, row):
+        key = self._session(session_id)
+        self.client.hset(self._trials(session_id), row["trial_index"], json.dumps(row))
+        r = self.client.hgetall(key)
+        update = {"current_index": max(int(r.get("current_index", 0)), row["trial_index"]),
+                  "updated_at": time.time()}
+        if r.get("status") == "abandoned":
+            update["status"] = "active"
+            self.client.sadd(self._active, session_id)
+        self.client.hset(key, mapping=update)
+
+    def session_rows(self, session_id):
+        trials = self.client.hgetall(self._trials(session_id))
+        return [json.loads(trials[k]) for k in sorted(trials, key=int)]
+
+    def status(self, session_id):
+        r = self.client.hgetall(self._session(session_id))
+        return r.get("status", "active") if r else None
+
+    def mark_complete(self, session_id):
+        self.client.hset(self._session(session_id), mapping={"status": "complete", "updated_at": time.time()})
+        self.client.srem(self._active, session_id)
+
+    def mark_abandoned(self, session_id):
+        if self.status(session_id) == "active":
+            self.client.hset(self._session(session_id), mapping={"status": "abandoned", "updated_at": time.time()})
+        self.client.srem(self._active, session_id)
+
+    def idle_sessions(self, before):
+        ids = list(self.client.smembers(self._active))
+        pipe = self.client.pipeline()
+        for session_id in ids:
+            pipe.hget(self._session(session_id), "status")
+            pipe.hget(self._session(session_id), "updated_at")
+        values = pipe.execute()
+        idle = []
+        for session_id, status, updated in zip(ids, values[::2], values[1::2]):
+            if status != "active":
+                self.client.srem(self._active, session_id)
+            elif float(updated or 0) < before:
+                idle.append(session_id)
+        return idle
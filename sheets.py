@@ -0,0 +1,212 @@
+import random
+import threading
+import time
+from string import ascii_uppercase, digits
+
+
+class TokenBucket:
+    """
+    Blocking rate limiter: `rate` operations per second on average, with
+    bursts of up to `burst`.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class SheetsPool:
+    """
+    One shared worksheet handle for the whole process.
+
+    `connect` opens a worksheet (gspread Worksheet or LocalWorksheet).
+    Every operation goes through `run`, which rate-limits to stay under
+    the Sheets API quota (60 writes per minute per user by default) and
+    checks the handle's health when it has been idle for `health_interval`
+    seconds. If an operation fails the handle is replaced and the error is
+    re-raised: appends are not idempotent, so retrying is left to the
+    caller (the write-behind queue backs off and retries the batch).
+    """
+
+    def __init__(self, connect, rate=1.0, burst=5, health_interval=300.0):
+        self.connect = connect
+        self.limiter = TokenBucket(rate, burst)
+        self.health_interval = health_interval
+        self.reconnects = 0
+        self._ws = None
+        self._last_ok = 0.0
+        self._lock = threading.Lock()
+
+    def _handle(self):
+        with self._lock:
+            if self._ws is None:
+                self._ws = self.connect()
+                self._last_ok = time.monotonic()
+            elif time.monotonic() - self._last_ok > self.health_interval and not self._healthy(self._ws):
+                self._reconnect()
+            return self._ws
+
+    def _healthy(self, ws):
+        try:
+            self.limiter.acquire()
+            ws.row_values(1)
+            self._last_ok = time.monotonic()
+            return True
+        except Exception:
+            return False
+
+    def _reconnect(self):
+        self._ws = self.connect()
+        self._last_ok = time.monotonic()
+        self.reconnects += 1
+
+    def run(self, op):
+        """
+        Calls op(worksheet) under the rate limit and returns its result.
+        """
+        ws = self._handle()
+        self.limiter.acquire()
+        try:
+            result = op(ws)
+        except Exception:
+            with self._lock:
+                # Another thread may already have replaced the handle
+                if self._ws is ws:
+                    self._ws = None
+                    self.reconnects += 1
+            raise
+        self._last_ok = time.monotonic()
+        return result
+
+
+def gsheets_connector(conn, worksheet="Sheet1"):
+    """
+    Returns a `connect` callable for SheetsPool that opens `worksheet`
+    through a streamlit-gsheets connection (service account required),
+    resetting the underlying client on every reconnect.
+    """
+    opened = []
+
+    def connect():
+        if opened:
+            conn.reset()
+        opened.append(True)
+        return conn.client._select_worksheet(worksheet=worksheet)
+
+    return connect
+
+
+class LocalWorksheet:
+    """
+    In-memory stand-in for a gspread Worksheet, implementing the calls the
+    app makes. `latency` (seconds per call) and `failure_rate` simulate the
+    remote API for offline throughput and failure testing.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, rng=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = rng or random.Random()
+        self.rows = []
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _call(self):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise ConnectionError("simulated Sheets API failure")
+
+    def row_values(self, row):
+        self._call()
+        with self._lock:
+            return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def get_all_values(self):
+        self._call()
+        with self._lock:
+            return [list(r) for r in self.rows]
+
+    def col_values(self, col, **kwargs):
+        self._call()
+        with self._lock:
+            return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+    def get(self, range_name, **kwargs):
+        # Only whole-row ("2:5001") and column-span ("A2:B5001") ranges are supported
+        self._call()
+        first, last = range_name.split(":")
+        start, stop = int(first.lstrip(ascii_uppercase)), int(last.lstrip(ascii_uppercase))
+        left, right = _column_index(first.rstrip(digits)), _column_index(last.rstrip(digits))
+        with self._lock:
+            rows = [list(r) for r in self.rows[start - 1:stop]]
+        if right is None:
+            return rows
+        rows = [r[left:right + 1] for r in rows]
+        # Like the API, drop trailing empty cells
+        for r in rows:
+            while r and r[-1] == "":
+                r.pop()
+        return rows
+
+    def append_row(self, values, **kwargs):
+        self.append_rows([values], **kwargs)
+
+    def append_rows(self, values, **kwargs):
+        self._call()
+        with self._lock:
+            self.rows.extend(list(r) for r in values)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        # Only whole-row updates starting in column A are supported
+        self._call()
+        start = int(range_name.lstrip("A") or 1) - 1
+        with self._lock:
+            for offset, row in enumerate(values):
+                while len(self.rows) <= start + offset:
+                    self.rows.append([])
+                self.rows[start + offset] = list(row)
+
+
+# Named in-memory worksheets, shared by everything in the process so a
+# load test can inspect what the app wrote.
+LOCAL_WORKSHEETS = {}
+_local_lock = threading.Lock()
+
+
+def _column_index(letters):
+    # A1 column letters to a 0-based index (None for a whole-row range)
+    if not letters:
+        return None
+    index = 0
+    for c in letters:
+        index = index * 26 + ord(c) - ord("A") + 1
+    return index - 1
+
+
+def local_worksheet(name="Sheet1", **kwargs):
+    """
+    Returns the process-wide LocalWorksheet called `name`, creating it with
+    `kwargs` (latency, failure_rate) on first use.
+    """
+    with _local_lock:
+        if name not in LOCAL_WORKSHEETS:
+            LOCAL_WORKSHEETS[name] = LocalWorksheet(**kwargs)
+        return LOCAL_WORKSHEETS[name]
@@ -0,0 +1,257 @@
+import os
+import sqlite3
+import threading
+from urllib.request import pathname2url
+
+# Column order used for every backend. New columns are only ever appended
+# to the end so existing sheets and databases stay readable.
+RESPONSE_COLUMNS = [
+    "session_id",
+    "trial_index",
+    "abstract_id",
+    "condition",
+    "credibility",
+    "urgency",
+    "policy_support",
+    "gov_funding",
+    "timestamp",
+    "shown_at_mono",
+    "submitted_at_mono",
+    "response_ms",
+    "session_status",
+]
+
+
+class ResponseStore:
+    """
+    Append-only store for response rows (one dict per trial).
+    Backends never read back existing data in order to write, so the cost
+    of a save depends only on the number of new rows.
+    """
+
+    def append(self, rows):
+        raise NotImplementedError
+
+    def iter_rows(self, since=None, until=None, condition=None, complete=None, trials=40, chunk_size=5000):
+        """
+        Yields stored rows as lists of at most `chunk_size` dicts, oldest
+        first. `since`/`until` bound the timestamp (epoch seconds, until is
+        exclusive), `condition` keeps one condition, and `complete` keeps
+        only sessions with at least `trials` distinct trials (True) or only
+        those with fewer (False).
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+def _matches(row, since, until, condition):
+    stamp = row.get("timestamp")
+    if since is not None and (stamp is None or stamp < since):
+        return False
+    if until is not None and (stamp is None or stamp >= until):
+        return False
+    return condition is None or row.get("condition") == condition
+
+
+# --- Local SQLite backend ---
+
+class SQLiteStore(ResponseStore):
+    """
+    Stores responses in a local SQLite database in WAL mode.
+    A single connection is shared between Streamlit sessions (threads);
+    writes are serialised with a lock and each append is one transaction.
+    """
+
+    def __init__(self, path="responses.db", table="responses"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_table()
+
+    def _create_table(self):
+        columns = ", ".join(f'"{c}"' for c in RESPONSE_COLUMNS)
+        with self._lock, self._conn:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" ({columns})')
+            # Add any columns introduced after the table was first created
+            existing = {r[1] for r in self._conn.execute(f'PRAGMA table_info("{self.table}")')}
+            for col in RESPONSE_COLUMNS:
+                if col not in existing:
+                    self._conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN "{col}"')
+        # One row per (session, trial), so a batch resent after a crash
+        # between append and acknowledgement is ignored. A table that
+        # already holds duplicates keeps plain inserts; screening flags them.
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    f'CREATE UNIQUE INDEX IF NOT EXISTS "{self.table}_trial_key" '
+                    f'ON "{self.table}" ("session_id", "trial_index")'
+                )
+            self._insert = "INSERT OR IGNORE"
+        except sqlite3.IntegrityError:
+            self._insert = "INSERT"
+
+    def append(self, rows):
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" for _ in RESPONSE_COLUMNS)
+        columns = ", ".join(f'"{c}"' for c in RESPONSE_COLUMNS)
+        values = [tuple(row.get(c) for c in RESPONSE_COLUMNS) for row in rows]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f'{self._insert} INTO "{self.table}" ({columns}) VALUES ({placeholders})', values
+            )
+        return len(values)
+
+    def iter_rows(self, since=None, until=None, condition=None, complete=None, trials=40, chunk_size=5000):
+        # Filters run in SQL, on a separate read-only connection so a long
+        # export never holds the lock that appends need
+        where, params = [], []
+        if since is not None:
+            where.append('"timestamp" >= ?')
+            params.append(since)
+        if until is not None:
+            where.append('"timestamp" < ?')
+            params.append(until)
+        if condition is not None:
+            where.append('"condition" = ?')
+            params.append(condition)
+        if complete is not None:
+            where.append(
+                f'"session_id" {"" if complete else "NOT "}IN (SELECT "session_id" FROM "{self.table}" '
+                f'GROUP BY "session_id" HAVING COUNT(DISTINCT "trial_index") >= ?)'
+            )
+            params.append(trials)
+        columns = ", ".join(f'"{c}"' for c in RESPONSE_COLUMNS)
+        sql = f'SELECT {columns} FROM "{self.table}"'
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        uri = "file:" + pathname2url(os.path.abspath(self.path)) + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=30)
+        try:
+            cursor = conn.execute(sql + " ORDER BY rowid", params)
+            while True:
+                batch = cursor.fetchmany(chunk_size)
+                if not batch:
+                    break
+                yield [dict(zip(RESPONSE_COLUMNS, r)) for r in batch]
+        finally:
+            conn.close()
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM "{self.table}"').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- Google Sheets backend ---
+
+class GSheetsStore(ResponseStore):
+    """
+    Appends rows to a worksheet through the Sheets `values.append` API.
+    Only the header row is ever read, so a save costs the same no matter
+    how many rows the sheet already holds, and two concurrent appends
+    land on separate rows instead of overwriting each other.
+    All calls go through a shared, rate-limited SheetsPool.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._lock = threading.Lock()
+        self._header = None
+
+    def _ensure_header(self, rows):
+        if self._header is None:
+            self._header = self.pool.run(lambda ws: ws.row_values(1))
+        if not self._header:
+            header = list(RESPONSE_COLUMNS)
+            self.pool.run(lambda ws: ws.append_row(header, value_input_option="RAW"))
+            self._header = header
+        # Extend the header if rows carry columns the sheet doesn't have yet
+        missing = [c for c in RESPONSE_COLUMNS if c not in self._header]
+        for row in rows:
+            missing += [k for k in row if k not in self._header and k not in missing]
+        if missing:
+            header = self._header + missing
+            self.pool.run(lambda ws: ws.update(range_name="A1", values=[header]))
+            self._header = header
+        return self._header
+
+    def append(self, rows):
+        if not rows:
+            return 0
+        with self._lock:
+            header = self._ensure_header(rows)
+        values = [[_cell(row.get(c)) for c in header] for row in rows]
+        self.pool.run(
+            lambda ws: ws.append_rows(values, value_input_option="RAW", insert_data_option="INSERT_ROWS")
+        )
+        return len(values)
+
+
+    def iter_rows(self, since=None, until=None, condition=None, complete=None, trials=40, chunk_size=5000):
+        # The Sheets API can't filter, so rows are fetched one row range
+        # at a time and filtered here; completeness needs one pass over
+        # the session_id and trial_index columns first, in the same ranges
+        header = self.pool.run(lambda ws: ws.row_values(1))
+        if not header:
+            return
+        keep = None
+        if complete is not None:
+            sid_col, trial_col = header.index("session_id"), header.index("trial_index")
+            left, right = min(sid_col, trial_col), max(sid_col, trial_col)
+            # One bit per trial_index, so memory grows with sessions, not rows
+            seen = {}
+            start = 2
+            while True:
+                rng = f"{_column(left)}{start}:{_column(right)}{start + chunk_size - 1}"
+                values = self.pool.run(lambda ws: ws.get(rng, value_render_option="UNFORMATTED_VALUE"))
+                for v in values:
+                    v = v + [""] * (right + 1 - left - len(v))
+                    sid, trial = v[sid_col - left], v[trial_col - left]
+                    # Session status records leave trial_index empty
+                    seen[sid] = seen.get(sid, 0) | (1 << int(trial) if trial != "" else 0)
+                if len(values) < chunk_size:
+                    break
+                start += chunk_size
+            keep = {sid for sid, bits in seen.items() if (bits.bit_count() >= trials) == complete}
+        start = 2
+        while True:
+            rng = f"{start}:{start + chunk_size - 1}"
+            values = self.pool.run(lambda ws: ws.get(rng, value_render_option="UNFORMATTED_VALUE"))
+            rows = []
+            for v in values:
+                row = {c: (v[i] if i < len(v) and v[i] != "" else None) for i, c in enumerate(header)}
+                if _matches(row, since, until, condition) and (keep is None or row["session_id"] in keep):
+                    rows.append(row)
+            if rows:
+                yield rows
+            if len(values) < chunk_size:
+                break
+            start += chunk_size
+
+
+def _column(index):
+    # 0-based column index to its A1 letters
+    letters = ""
+    index += 1
+    while index:
+        index, rem = divmod(index - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def _cell(value):
+    # The Sheets API only accepts JSON scalars
+    if value is None:
+        return ""
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    return str(value)
@@ -0,0 +1,122 @@
+"""
+Streams stored responses out as NDJSON or CSV, a chunk at a time.
+
+    python streaming.py responses.db --format csv --since 2026-03-01 --complete 1 > complete.csv
+    curl "http://host:$SURVEY_METRICS_PORT/export?token=$SURVEY_ADMIN_TOKEN&format=ndjson&condition=war"
+
+Filters are handed to the store's `iter_rows`, so SQLite applies them in
+its query and memory stays at one chunk whatever the size of the study.
+"""
+import argparse
+import csv
+import hmac
+import io
+import json
+import sys
+from datetime import datetime, timezone
+
+from sequence import CONDITIONS
+from storage import RESPONSE_COLUMNS, SQLiteStore
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _epoch(value):
+    # Epoch seconds, or an ISO date/datetime (UTC unless it says otherwise)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    stamp = datetime.fromisoformat(value)
+    if stamp.tzinfo is None:
+        stamp = stamp.replace(tzinfo=timezone.utc)
+    return stamp.timestamp()
+
+
+def parse_filters(params):
+    """
+    Turns string parameters (query string or command line) into
+    `iter_rows` keyword arguments. Raises ValueError on bad input.
+    """
+    filters = {}
+    for key in ("since", "until"):
+        if params.get(key):
+            filters[key] = _epoch(params[key])
+    if params.get("condition"):
+        if params["condition"] not in CONDITIONS:
+            raise ValueError(f"condition must be one of {', '.join(CONDITIONS)}")
+        filters["condition"] = params["condition"]
+    if params.get("complete"):
+        value = params["complete"].lower()
+        if value not in ("1", "0", "true", "false"):
+            raise ValueError("complete must be 1 or 0")
+        filters["complete"] = value in ("1", "true")
+    return filters
+
+
+def encode(chunks, fmt="ndjson"):
+    """
+    Yields each chunk of row dicts as bytes in `fmt`.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+    if fmt == "ndjson":
+        for rows in chunks:
+            yield "".join(json.dumps(row) + "\n" for row in rows).encode()
+        return
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=RESPONSE_COLUMNS, extrasaction="ignore")
+    writer.writeheader()
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue().encode()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode()
+
+
+def export_route(get_store, token):
+    """
+    Returns a metrics.serve route for /export, answering only requests
+    that carry `token`. `get_store` is called on the first request, so
+    serving metrics doesn't open the store.
+    """
+    def route(params):
+        if not token or not hmac.compare_digest(params.get("token", ""), token):
+            return 403, "text/plain", [b"forbidden\n"]
+        fmt = params.get("format", "ndjson")
+        try:
+            filters = parse_filters(params)
+            if fmt not in FORMATS:
+                raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        except ValueError as e:
+            return 400, "text/plain", [f"{e}\n".encode()]
+        return 200, FORMATS[fmt], encode(get_store().iter_rows(**filters), fmt)
+    return route
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("db", help="SQLiteStore database")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    parser.add_argument("--since", help="epoch seconds or ISO date")
+    parser.add_argument("--until", help="epoch seconds or ISO date (exclusive)")
+    parser.add_argument("--condition", choices=CONDITIONS)
+    parser.add_argument("--complete", choices=["1", "0"], help="only complete (1) or partial (0) sessions")
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    try:
+        filters = parse_filters(vars(args))
+    except ValueError as e:
+        parser.error(str(e))
+    store = SQLiteStore(args.db)
+    out = sys.stdout.buffer
+    for data in encode(store.iter_rows(chunk_size=args.chunk_size, **filters), args.format):
+        out.write(data)
+    out.flush()
+
+
+if __name__ == "__main__":
+    main()
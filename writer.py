@@ -0,0 +1,236 @@
+import atexit
+import json
+import os
+import random
+import socket
+import sqlite3
+import threading
+import time
+
+from coordination import LockTimeout
+from idempotency import IdempotencyIndex, row_key
+from metrics import REGISTRY
+
+
+class QueueFull(Exception):
+    pass
+
+
+class WriteBehindQueue:
+    """
+    Process-wide write-behind queue in front of a ResponseStore.
+
+    `put` commits rows to an on-disk SQLite spool and returns immediately;
+    a background thread drains the spool into the store in batches, either
+    when `batch_size` rows are waiting or every `flush_interval` seconds.
+    Rows only leave the spool after the store accepted them, so anything
+    queued survives a crash or restart and is sent on the next start.
+    Memory is bounded by one batch; the spool itself is capped at
+    `max_pending` rows, after which `put` raises QueueFull.
+    Callables in `listeners` are called with each batch after the store
+    has accepted it.
+
+    Replicas on one host may share a spool if they share a `coordinator`:
+    draining a batch (read, append, acknowledge, listeners) then happens
+    under a lock named after the host and spool, so no batch is sent twice.
+
+    With `dedupe` on, every row's (session_id, trial_index) is claimed in
+    an IdempotencyIndex stored in the spool, in the same transaction that
+    spools the row; if spooling fails, the claim is rolled back with it.
+    A rerun, reconnect or retried commit that puts the same trials again
+    gets them dropped at the door, and each trial is spooled (and so sent
+    to the store) at most once. Keys new to this spool are also claimed
+    through the coordinator, for replicas on other hosts with spools of
+    their own (see Coordinator.claim); those claims are given back if the
+    spool transaction rolls back.
+    """
+
+    def __init__(self, store, spool_path="spool.db", batch_size=500,
+                 flush_interval=2.0, max_pending=100000,
+                 base_backoff=1.0, max_backoff=60.0, coordinator=None, dedupe=True):
+        self.store = store
+        self.coordinator = coordinator
+        # Names this spool among every replica's, for shared claims and the
+        # drain lock: hosts with their own spools at the same path don't
+        # wait on each other
+        self.replica = f"{socket.gethostname()}:{os.path.abspath(spool_path)}"
+        self._drain_lock = "spool:" + self.replica
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        # Autocommit: put() opens its own transaction, so claiming keys and
+        # spooling their rows commit or roll back together
+        self._conn = sqlite3.connect(spool_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # FULL so that a row acknowledged by put() survives power loss
+        self._conn.execute("PRAGMA synchronous=FULL")
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS spool (id INTEGER PRIMARY KEY AUTOINCREMENT, row TEXT NOT NULL)"
+            )
+            self._index = IdempotencyIndex(self._conn) if dedupe else None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._pending = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        self._stopping = False
+        self._failures = 0
+        self.last_error = None
+        self.listeners = []
+        self._thread = None
+
+    # --- Producer side ---
+
+    def put(self, rows):
+        """
+        Durably spools `rows`. Returns once they are on disk, with the
+        number of rows spooled (rows already put before are skipped).
+        """
+        if not rows:
+            return 0
+        offered = len(rows)
+        payload = [json.dumps(row) for row in rows]
+        with self._lock:
+            if self._pending + offered > self.max_pending:
+                raise QueueFull(f"write-behind spool is full ({self._pending} rows pending)")
+            with REGISTRY.time("survey_spool_write_seconds"):
+                keys = [row_key(row) for row in rows] if self._index is not None else []
+                shared = []
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if self._index is not None:
+                        fresh = self._index.claim(keys)
+                        if self.coordinator is not None:
+                            # Only keys new to this spool need the round trip
+                            ask = [j for j, new in enumerate(fresh) if new and keys[j] is not None]
+                            granted = self.coordinator.claim("rows", [keys[j] for j in ask], self.replica)
+                            for j, ok in zip(ask, granted):
+                                fresh[j] = ok
+                            shared = [keys[j] for j, ok in zip(ask, granted) if ok]
+                        payload = [row for row, new in zip(payload, fresh) if new]
+                        keys = [key for key, new in zip(keys, fresh) if new]
+                    self._conn.executemany("INSERT INTO spool (row) VALUES (?)", [(row,) for row in payload])
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    if shared:
+                        self.coordinator.unclaim("rows", shared)
+                    raise
+            if self._index is not None:
+                self._index.remember(keys)
+            if offered > len(payload):
+                REGISTRY.inc("survey_duplicate_rows_total", offered - len(payload))
+            self._pending += len(payload)
+            if self._pending >= self.batch_size:
+                self._wakeup.notify()
+        return len(payload)
+
+    def pending(self):
+        with self._lock:
+            return self._pending
+
+    # --- Worker lifecycle ---
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+        return self
+
+    def flush(self, timeout=None):
+        """
+        Wakes the worker and waits until the spool is empty (or timeout).
+        Returns True if everything was flushed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._wakeup.notify()
+        while self.pending():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout=10.0):
+        if self._thread is None:
+            return
+        self.flush(timeout)
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+        self._thread.join(timeout)
+        self._thread = None
+
+    # --- Consumer side ---
+
+    def _next_batch(self):
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT id, row FROM spool ORDER BY id LIMIT ?", (self.batch_size,)
+            )
+            return cur.fetchall()
+
+    def _ack(self, last_id, count):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM spool WHERE id <= ?", (last_id,))
+            self._pending -= count
+
+    def _backoff(self):
+        # Exponential backoff with full jitter, capped at max_backoff
+        delay = min(self.max_backoff, self.base_backoff * (2 ** (self._failures - 1)))
+        return random.uniform(0, delay)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                if self._pending < self.batch_size:
+                    self._wakeup.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            if self.coordinator is None:
+                ok = self._drain()
+            else:
+                try:
+                    with self.coordinator.lock(self._drain_lock, timeout=self.flush_interval):
+                        ok = self._drain()
+                        # Other replicas put into and drain the same spool
+                        with self._lock:
+                            self._pending = self._conn.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+                except LockTimeout:
+                    continue
+            if not ok:
+                time.sleep(self._backoff())
+
+    def _drain(self):
+        """
+        Sends one batch to the store. Returns False if the store failed.
+        """
+        batch = self._next_batch()
+        if not batch:
+            return True
+        backend = type(self.store).__name__
+        rows = [json.loads(row) for _, row in batch]
+        try:
+            with REGISTRY.time("survey_store_append_seconds", store=backend):
+                self.store.append(rows)
+        except Exception as e:
+            REGISTRY.inc("survey_store_errors_total", store=backend)
+            self._failures += 1
+            self.last_error = repr(e)
+            return False
+        self._failures = 0
+        self.last_error = None
+        self._ack(batch[-1][0], len(batch))
+        REGISTRY.inc("survey_rows_flushed_total", len(batch), store=backend)
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                self.last_error = repr(e)
+        return True